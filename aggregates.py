@@ -0,0 +1,93 @@
+# aggregates.py
+"""本日データの集計（追加・削除のたびに差分で更新）"""
+from talk_parser import back_counts
+
+
+def store_totals(by_store):
+    """店舗別の (金額, 件数) から店舗別合計の行を作る（金額の多い順）"""
+    return [
+        {'店舗名': store, '金額': amount}
+        for store, (amount, _) in sorted(by_store.items(), key=lambda item: item[1][0], reverse=True)
+    ]
+
+
+def day_summary(entries):
+    """1日分の集計（件数・合計・店舗別合計）。記録保持データと一緒に保存する"""
+    by_store = {}
+    total = 0
+    for entry in entries:
+        total += entry['金額']
+        by_store[entry['店舗名']] = by_store.get(entry['店舗名'], 0) + entry['金額']
+    return {'件数': len(entries), '合計': total, '店舗別': by_store}
+
+
+class DailyTotals:
+    """
+    本日データの合計・件数と、店舗別・入力者別・入力者×店舗別の (金額, 件数)、バック記号別の (件数, 人数, バック合計)
+    追加・削除のたびに差分だけ更新するので、表示のたびに全件を集計し直さなくてよい
+    （内容の解析も追加・削除した行の分だけ）
+    """
+
+    def __init__(self, entries=()):
+        self.reset(entries)
+
+    def reset(self, entries=()):
+        """集計を作り直す（営業日の切り替え時など）"""
+        self.total = 0
+        self.count = 0
+        self.by_store = {}
+        self.by_user = {}
+        self.by_user_store = {}
+        self.by_back = {}
+        self.add(entries)
+
+    def add(self, entries):
+        for entry in entries:
+            self._bump(entry, 1)
+        self._bump_backs(entries, 1)
+
+    def remove(self, entries):
+        for entry in entries:
+            self._bump(entry, -1)
+        self._bump_backs(entries, -1)
+
+    def _bump_backs(self, entries, sign):
+        """追加・削除した行の内容だけを解析して、バック記号別の集計に足し引きする"""
+        counts = back_counts([entry.get('内容') or '' for entry in entries])
+        for code, (rows, people, back_sum) in counts.items():
+            old_rows, old_people, old_back_sum = self.by_back.get(code, (0, 0, 0))
+            rows = old_rows + rows * sign
+            if rows:
+                self.by_back[code] = (rows, old_people + people * sign, old_back_sum + back_sum * sign)
+            else:
+                self.by_back.pop(code, None)
+
+    def _bump(self, entry, sign):
+        amount = entry['金額'] * sign
+        store = entry['店舗名']
+        user = entry['入力者']
+        self.total += amount
+        self.count += sign
+        for table, key in (
+            (self.by_store, store),
+            (self.by_user, user),
+            (self.by_user_store, (user, store)),
+        ):
+            amount_sum, count = table.get(key, (0, 0))
+            count += sign
+            if count:
+                table[key] = (amount_sum + amount, count)
+            else:
+                # 件数が0になったら表示しないよう取り除く
+                table.pop(key, None)
+
+    def snapshot(self):
+        """表示用のコピー（店舗・入力者の数に比例する手間）"""
+        return {
+            'total': self.total,
+            'count': self.count,
+            'by_store': dict(self.by_store),
+            'by_user': dict(self.by_user),
+            'by_user_store': dict(self.by_user_store),
+            'by_back': dict(self.by_back),
+        }
@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+"""性能測定（合成トーク履歴の生成・解析・保存・集計）"""
@@ -0,0 +1,101 @@
+# benchmarks/common.py
+"""測定の共通処理（時間計測・結果表・しきい値と前回結果との比較）"""
+import json
+import time
+
+
+def best_time(func, repeat=3):
+    """func() を repeat 回実行して最短の秒数と最後の戻り値を返す"""
+    best = None
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def parse_sizes(text):
+    """'100,1k,10k,1m' のような指定を行数のリストにする"""
+    sizes = []
+    for part in text.split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        scale = 1
+        if part[-1] in 'km':
+            scale = 1000 if part[-1] == 'k' else 1000000
+            part = part[:-1]
+        sizes.append(int(float(part) * scale))
+    return sizes
+
+
+def print_table(rows, columns):
+    """結果を列をそろえて表示する（rows: 辞書のリスト, columns: [(キー, 見出し), ...]）"""
+    cells = [[title for _, title in columns]]
+    for row in rows:
+        cells.append([_format(row.get(key)) for key, _ in columns])
+    widths = [max(_width(line[i]) for line in cells) for i in range(len(columns))]
+    for n, line in enumerate(cells):
+        print('  '.join(_pad(cell, width) for cell, width in zip(line, widths)))
+        if n == 0:
+            print('  '.join('-' * width for width in widths))
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if value >= 100:
+            return f"{value:,.0f}"
+        return f"{value:,.3f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def _width(text):
+    # 全角文字は2桁として数える
+    return sum(2 if ord(ch) > 0x2E80 else 1 for ch in text)
+
+
+def _pad(text, width):
+    return text + ' ' * (width - _width(text))
+
+
+def check_results(rows, thresholds, baseline=None, tolerance=0.2, min_size=0):
+    """
+    しきい値と前回結果で性能の低下を判定し、各行に 'status' を付ける
+    thresholds: {測定名: 最低スループット（1秒あたり）}
+    min_size: これより小さいサイズの行はしきい値では判定しない（前回結果との比較はする）
+    baseline: 前回の結果（save_results の形式）。同じ測定・サイズで tolerance 以上遅くなったら低下
+    戻り値: 低下した行のリスト
+    """
+    previous = {}
+    if baseline:
+        previous = {(row['name'], row['size']): row['throughput'] for row in baseline}
+    failures = []
+    for row in rows:
+        problems = []
+        minimum = thresholds.get(row['name'])
+        if minimum is not None and row['size'] >= min_size and row['throughput'] < minimum:
+            problems.append(f"< {minimum:,.0f}/s")
+        before = previous.get((row['name'], row['size']))
+        if before and row['throughput'] < before * (1 - tolerance):
+            problems.append(f"前回比 {row['throughput'] / before:.0%}")
+        row['status'] = 'NG ' + ', '.join(problems) if problems else 'OK'
+        if problems:
+            failures.append(row)
+    return failures
+
+
+def save_results(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=1)
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,117 @@
+# benchmarks/cube_bench.py
+"""
+分析タブの集計（集計キューブ ↔ 記録の明細から集計し直す場合）
+  python -m benchmarks.cube_bench                      # 90, 365, 1095 日
+  python -m benchmarks.cube_bench --days 365 --entries 5k --save cube.json
+
+各日 entries 件（合成トーク履歴）をキューブに入れて、週・月の合計、店舗ランキング、入力者の推移を測る。
+キューブでの1回の集計が MAX_QUERY_MS を超えたら失敗とする
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.common import best_time, parse_sizes, print_table, save_results
+from benchmarks.talk_history import talk_entries
+from cube import SalesCube, period_list, period_totals, store_ranking, user_trend
+
+DEFAULT_DAYS = '90,365,1095'
+DEFAULT_ENTRIES = '1k'
+
+# キューブでの1回の集計の上限（ミリ秒）
+MAX_QUERY_MS = 100.0
+
+# 測る集計
+QUERIES = {
+    'week_totals': lambda frame: period_totals(frame, 'W'),
+    'month_totals': lambda frame: period_totals(frame, 'M'),
+    'store_ranking': lambda frame: store_ranking(frame),
+    'month_ranking': lambda frame: store_ranking(frame, period_list(frame, 'M')[0]),
+    'user_trend': lambda frame: user_trend(frame, 'W'),
+}
+
+
+def _days(count, entries):
+    """count 日分（今日から遡る）。日ごとに件数の一部をずらして使う"""
+    today = datetime.date.today()
+    step = max(len(entries) // 7, 1)
+    days = {}
+    for n in range(1, count + 1):
+        shift = n * step % len(entries)
+        days[(today - datetime.timedelta(days=n)).isoformat()] = entries[shift:] + entries[:shift]
+    return days
+
+
+def _raw_month_totals(days):
+    """明細から集計し直す場合（全日のデータを DataFrame にして月ごとに合計）"""
+    rows = [(date, entry['店舗名'], entry['入力者'], entry['金額']) for date, entries in days.items() for entry in entries]
+    frame = pd.DataFrame(rows, columns=['営業日', '店舗名', '入力者', '金額'])
+    frame['営業日'] = pd.to_datetime(frame['営業日'])
+    return frame.groupby(frame['営業日'].dt.to_period('M'))['金額'].agg(['sum', 'count'])
+
+
+def run(day_counts, size, repeat=3):
+    rows = []
+    entries = talk_entries(size)
+    for count in day_counts:
+        days = _days(count, entries)
+        directory = tempfile.mkdtemp(prefix='totalcash_cube_')
+        try:
+            path = os.path.join(directory, 'cube.jsonl')
+            # 追加は1回だけ（繰り返すと同じ日の行が増える）
+            seconds, _ = best_time(lambda: SalesCube(path).put_days(days), 1)
+            row = {'days': count, 'entries': size, 'put_ms': seconds * 1000}
+            # 読み込み = 起動時にファイルを読んで DataFrame にするまで
+            seconds, frame = best_time(lambda: SalesCube(path).frame(), repeat)
+            row['load_ms'] = seconds * 1000
+            row['cells'] = len(frame)
+            for name, query in QUERIES.items():
+                seconds, _ = best_time(lambda: query(frame), repeat)
+                row[name] = seconds * 1000
+            seconds, _ = best_time(lambda: _raw_month_totals(days), 1)
+            row['raw_month_ms'] = seconds * 1000
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        rows.append(row)
+        print(f"  {count}日", file=sys.stderr)
+    return rows
+
+
+def check(rows):
+    failures = []
+    for row in rows:
+        slow = [name for name in QUERIES if row[name] > MAX_QUERY_MS]
+        row['status'] = 'NG ' + ', '.join(slow) if slow else 'OK'
+        if slow:
+            failures.append(row)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析タブの集計（集計キューブ ↔ 明細から集計し直す場合）")
+    parser.add_argument('--days', default=DEFAULT_DAYS, help="日数（例: 90,365,1095）")
+    parser.add_argument('--entries', default=DEFAULT_ENTRIES, help="1日あたりの件数（例: 1k）")
+    parser.add_argument('--repeat', type=int, default=3, help="1つの集計を測る回数")
+    parser.add_argument('--save', help="結果を JSON に保存")
+    args = parser.parse_args(argv)
+
+    rows = run(parse_sizes(args.days), parse_sizes(args.entries)[0], args.repeat)
+    failures = check(rows)
+    print_table(rows, [
+        ('days', '日数'), ('entries', '1日の件数'), ('cells', 'セル数'), ('put_ms', '追加(ms)'),
+        ('load_ms', '読み込み(ms)'), ('week_totals', '週の合計(ms)'), ('month_totals', '月の合計(ms)'),
+        ('store_ranking', '店舗順位(ms)'), ('month_ranking', '月の店舗順位(ms)'), ('user_trend', '入力者推移(ms)'),
+        ('raw_month_ms', '明細から月の合計(ms)'), ('status', '判定'),
+    ])
+    if args.save:
+        save_results(args.save, rows)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
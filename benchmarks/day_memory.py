@@ -0,0 +1,94 @@
+# benchmarks/day_memory.py
+"""
+本日データのメモリと DataFrame 作成の比較（辞書のリスト ↔ 列指向の DayTable）
+  python -m benchmarks.day_memory                   # 1k, 10k, 50k, 100k 件
+  python -m benchmarks.day_memory --sizes 10k --save memory.json
+
+辞書のリストは app_data.json から読み込んだときと同じく json.loads で作る（1件ごとに別の文字列になる）
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.common import parse_sizes, print_table, save_results
+from benchmarks.talk_history import talk_entries
+from day_table import ENTRY_ID, DayTable
+
+DEFAULT_SIZES = '1k,10k,50k,100k'
+
+# 辞書のリストに対して、これ以上メモリが減っていなければ失敗
+MIN_REDUCTION = 0.5
+
+
+def _retained(build):
+    """build() が返したものが持ち続けるメモリ（バイト）と、その戻り値"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return retained, result
+
+
+def _best_ms(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes):
+    rows = []
+    for size in sizes:
+        entries = [dict(entry, **{ENTRY_ID: n + 1}) for n, entry in enumerate(talk_entries(size))]
+        text = json.dumps(entries, ensure_ascii=False)
+        del entries
+
+        list_bytes, dicts = _retained(lambda: json.loads(text))
+        table_bytes, table = _retained(lambda: DayTable(json.loads(text)))
+        rows.append({
+            'size': size,
+            'list_mb': list_bytes / 1024 / 1024,
+            'table_mb': table_bytes / 1024 / 1024,
+            'reduction': 1 - table_bytes / list_bytes,
+            'list_frame_ms': _best_ms(lambda: pd.DataFrame(dicts)),
+            'table_frame_ms': _best_ms(table.to_frame),
+            'frame_mb': pd.DataFrame(dicts).memory_usage(deep=True).sum() / 1024 / 1024,
+            'table_frame_mb': table.to_frame().memory_usage(deep=True).sum() / 1024 / 1024,
+        })
+        print(f"  {size:,}件", file=sys.stderr)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本日データのメモリと DataFrame 作成の比較")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="件数（例: 1k,10k,50k）")
+    parser.add_argument('--save', help="結果を JSON に保存")
+    args = parser.parse_args(argv)
+
+    rows = run(parse_sizes(args.sizes))
+    for row in rows:
+        row['status'] = 'OK' if row['reduction'] >= MIN_REDUCTION else f"NG < {MIN_REDUCTION:.0%}"
+    print_table(rows, [
+        ('size', '件数'), ('list_mb', '辞書のリスト(MB)'), ('table_mb', 'DayTable(MB)'), ('reduction', '削減率'),
+        ('list_frame_ms', 'DataFrame作成(ms)'), ('table_frame_ms', 'to_frame(ms)'),
+        ('frame_mb', 'DataFrame(MB)'), ('table_frame_mb', 'to_frame(MB)'), ('status', '判定'),
+    ])
+    if args.save:
+        save_results(args.save, rows)
+    return 0 if all(row['status'] == 'OK' for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# benchmarks/history_bench.py
+"""
+記録保持している日数と 起動・追加・まとめ直し の時間
+  python -m benchmarks.history_bench                      # 0, 3, 30, 90 日
+  python -m benchmarks.history_bench --days 0,30 --entries 10k --save history.json
+
+本日分と過去の各日に同じ件数を入れた JournalStore で測る。
+過去の日は営業日ごとのファイルにあるので、日数が増えても本日分の操作は重くならないはず。
+過去の日がないときに比べて MAX_RATIO 倍を超えた項目を失敗とする
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.common import best_time, parse_sizes, print_table, save_results
+from benchmarks.talk_history import talk_entries
+from business_date import DATE_FORMAT
+from storage import JournalStore
+
+DEFAULT_DAYS = '0,3,30,90'
+DEFAULT_ENTRIES = '5k'
+
+# 過去の日がないときに対する倍率の上限
+MAX_RATIO = 2.0
+# これより速い項目は誤差が大きいので判定しない（ミリ秒）
+RATIO_FLOOR_MS = 5.0
+
+# 測る項目
+CASES = [('startup', '起動(ms)'), ('add', '追加1回(ms)'), ('compact', 'まとめ直し(ms)')]
+
+
+def _open(directory):
+    return JournalStore(
+        snapshot_path=os.path.join(directory, 'app_data.json'),
+        journal_path=os.path.join(directory, 'app_data.journal'),
+    )
+
+
+def seed(directory, history_days, entries):
+    """本日分 entries と、過去 history_days 日分（各日 entries）を保存する"""
+    store = _open(directory)
+    today = datetime.datetime.strptime(store.today_date, DATE_FORMAT)
+    for n in range(1, history_days + 1):
+        date = (today - datetime.timedelta(days=n)).strftime(DATE_FORMAT)
+        store.apply({'op': 'put_days', 'days': {date: entries}})
+    store.apply({'op': 'add', 'entries': entries})
+    # 書き込みが終わってからまとめ直す（残ったジャーナルの行を起動時に読まないように）
+    store.flush()
+    store.compact()
+    store.close()
+
+
+def measure(directory, entries, repeat):
+    """起動・1件の追加（書き込み完了まで）・まとめ直し の最短時間（ミリ秒）"""
+    seconds, store = best_time(lambda: _open(directory), repeat)
+    result = {'startup': seconds * 1000}
+    entry = entries[:1]
+    seconds, _ = best_time(lambda: store.apply({'op': 'add', 'entries': entry}).wait(), repeat)
+    result['add'] = seconds * 1000
+    seconds, _ = best_time(store.compact, repeat)
+    result['compact'] = seconds * 1000
+    result['snapshot_kb'] = os.path.getsize(os.path.join(directory, 'app_data.json')) / 1024
+    store.close()
+    return result
+
+
+def run(day_counts, size, repeat=3):
+    rows = []
+    entries = talk_entries(size)
+    for history_days in day_counts:
+        directory = tempfile.mkdtemp(prefix='totalcash_history_')
+        try:
+            seed(directory, history_days, entries)
+            row = {'days': history_days, 'entries': size}
+            row.update(measure(directory, entries, repeat))
+            rows.append(row)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print(f"  {history_days}日", file=sys.stderr)
+    return rows
+
+
+def check(rows):
+    """最初の行（いちばん少ない日数）に対する倍率で判定し、各行に 'status' を付ける"""
+    base = rows[0]
+    failures = []
+    for row in rows:
+        problems = []
+        for key, title in CASES:
+            if row[key] >= RATIO_FLOOR_MS and row[key] > base[key] * MAX_RATIO:
+                problems.append(f"{title} {row[key] / base[key]:.1f}倍")
+        row['status'] = 'NG ' + ', '.join(problems) if problems else 'OK'
+        if problems:
+            failures.append(row)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記録保持している日数と 起動・追加・まとめ直し の時間")
+    parser.add_argument('--days', default=DEFAULT_DAYS, help="記録保持している過去の日数（例: 0,3,30,90）")
+    parser.add_argument('--entries', default=DEFAULT_ENTRIES, help="1日あたりの件数（例: 5k）")
+    parser.add_argument('--repeat', type=int, default=3, help="1つの項目を測る回数")
+    parser.add_argument('--save', help="結果を JSON に保存")
+    args = parser.parse_args(argv)
+
+    day_counts = sorted(parse_sizes(args.days))
+    rows = run(day_counts, parse_sizes(args.entries)[0], args.repeat)
+    failures = check(rows)
+    print_table(rows, [('days', '過去の日数'), ('entries', '1日の件数')] + CASES + [
+        ('snapshot_kb', 'スナップショット(KB)'), ('status', '判定'),
+    ])
+    if args.save:
+        save_results(args.save, rows)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
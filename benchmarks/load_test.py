@@ -0,0 +1,461 @@
+# benchmarks/load_test.py
+"""
+同時入力の負荷試験（閉店間際に複数のスタッフが同時に入力する状況）
+N 個のセッションに追加・削除・営業日の切り替え・再表示を繰り返させて
+  - 1回の操作の時間（p50 / p95）
+  - 保存ファイルへの書き込み回数
+  - 消えたデータ・二重に入ったデータ
+を表示する
+
+  app:   streamlit.testing の AppTest で main.py のセッションを N 個動かす
+         （AppTest は同時に実行できないため、再実行そのものは1つずつ。
+          セッション同士の操作は入り混じるので、他の端末の変更との競合は起きる）
+  store: N 個のスレッドから共有データ（SharedStore）を同時に操作する
+         （画面と同じ操作を本当に並行して行い、まとめ書き込みの効果を見る）
+  営業日の切り替えは、朝7時に RolloverScheduler が行う1回分（check）を呼んで再現する
+
+  python -m benchmarks.load_test --sessions 10 --actions 30
+  python -m benchmarks.load_test --mode store --sessions 32 --actions 200
+"""
+import argparse
+import collections
+import datetime
+import functools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import streamlit as st
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.testing.v1 import AppTest
+
+import business_date
+import retention
+import scheduler
+import storage
+from benchmarks.common import print_table
+from scheduler import RolloverScheduler
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+# 操作の割合（再表示 = 他の操作をせずにページを読み直す）
+ACTION_WEIGHTS = {'add': 6, 'delete': 2, 'open': 2, 'rollover': 1}
+
+# data_editor の削除チェック列
+DELETE_COLUMN = '🗑️ 削除'
+
+# AppTest の実行は同時に1つだけ（設定やランタイムをプロセス全体で差し替えるため）
+_APP_LOCK = threading.Lock()
+
+
+class FakeClock:
+    """営業日を進められる時計（全セッション共通）"""
+
+    def __init__(self, start):
+        self.date = start
+        self.rollovers = 0
+        self._lock = threading.Lock()
+
+    def today(self):
+        return self.date.strftime(business_date.DATE_FORMAT)
+
+    def now(self):
+        """営業日の正午（RolloverScheduler の now に渡す）"""
+        return datetime.datetime.combine(self.date, datetime.time(12))
+
+    def advance(self, limit):
+        """営業日を1日進める（limit 回まで）"""
+        with self._lock:
+            if self.rollovers >= limit:
+                return False
+            self.date += datetime.timedelta(days=1)
+            self.rollovers += 1
+            return True
+
+
+class Session:
+    """1台の端末（AppTest 1つ）"""
+
+    def __init__(self, number, timeout):
+        self.number = number
+        self.user = f"staff{number}"
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.latencies = collections.defaultdict(list)
+        self.waits = []       # 他のセッションの再実行を待った時間
+        self.added = []       # 追加した店舗名（1件ごとに一意）
+        self.deleted = []     # 削除できた店舗名
+        self.conflicts = 0    # 他の端末の変更でチェックが外れた回数
+        self.errors = []
+        self._serial = 0
+
+    def run(self, kind, editor_state=None):
+        """再実行して時間を記録する（editor_state: data_editor のチェック状態）"""
+        queued = time.perf_counter()
+        with _APP_LOCK:
+            start = time.perf_counter()
+            if editor_state is None:
+                self.app.run()
+            else:
+                states = self.app._tree.get_widget_states()
+                states.widgets.append(editor_state)
+                self.app._run(states)
+            self.latencies[kind].append(time.perf_counter() - start)
+        self.waits.append(start - queued)
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+    def messages(self, kind):
+        return [element.value for element in getattr(self.app, kind)]
+
+    def add(self):
+        self._serial += 1
+        store_name = f"S{self.number}-{self._serial}"
+        self.app.text_input(key='single_user').input(self.user)
+        self.app.text_area(key='combined_input').input(f"{store_name}\n1.1000")
+        self.app.button(key='add_single_talk').click()
+        self.run('add')
+        if any(store_name in message for message in self.messages('success')):
+            self.added.append(store_name)
+
+    def delete(self, rng):
+        """
+        自分が追加した行を1つ選んで削除する（一覧を開く → チェック → 削除ボタン）
+        チェックから削除までの間に他の端末が一覧を変えると、チェックが外れる
+        """
+        self.run('open')
+        editors = [frame for frame in self.app.dataframe if frame.key == 'data_editor']
+        if not editors:
+            return
+        rows = editors[0].value
+        own = [i for i, store_name in enumerate(rows['店舗名']) if str(store_name).startswith(f"S{self.number}-")]
+        if not own:
+            return
+        position = rng.choice(own)
+        store_name = rows['店舗名'].iloc[position]
+        state = WidgetState(
+            id=editors[0].proto.id,
+            string_value=json.dumps(
+                {'edited_rows': {str(position): {DELETE_COLUMN: True}}, 'added_rows': [], 'deleted_rows': []}
+            ),
+        )
+        self.run('delete', state)
+        buttons = [button for button in self.app.button if button.label.startswith('🗑️ 選択した')]
+        if not buttons:
+            # 一覧が変わってチェックが外れた
+            self.conflicts += 1
+            return
+        buttons[0].click()
+        self.run('delete', state)
+        if any(message == '1件のデータを削除しました' for message in self.messages('success')):
+            self.deleted.append(store_name)
+
+
+class StoreWorker:
+    """共有データを直接操作する1台の端末（画面の追加・削除と同じ操作）"""
+
+    def __init__(self, number, store):
+        self.number = number
+        self.user = f"staff{number}"
+        self.store = store
+        self.latencies = collections.defaultdict(list)
+        self.waits = []
+        self.added = []
+        self.deleted = []
+        self.conflicts = 0
+        self.errors = []
+        self._serial = 0
+
+    def _timed(self, kind, func):
+        start = time.perf_counter()
+        result = func()
+        self.latencies[kind].append(time.perf_counter() - start)
+        return result
+
+    def add(self):
+        self._serial += 1
+        store_name = f"S{self.number}-{self._serial}"
+        entry = {'時刻': '20:00', '入力者': self.user, '店舗名': store_name, '内容': '1.1000', '金額': 1000}
+        if self._timed('add', lambda: self.store.apply({'op': 'add', 'entries': [entry]})):
+            self.added.append(store_name)
+
+    def delete(self, rng):
+        """画面と同じく、表示した一覧から自分の行を1つ選んで ID で削除する"""
+        view = self._timed('open', self.store.today_view)
+        prefix = f"S{self.number}-"
+        frame = view['frame']
+        own = [
+            (store_name, entry_id)
+            for store_name, entry_id in zip(frame['店舗名'].tolist(), frame[storage.ENTRY_ID].tolist())
+            if store_name.startswith(prefix)
+        ]
+        if not own:
+            return
+        store_name, entry_id = rng.choice(own)
+        op = {'op': 'delete', 'ids': [entry_id]}
+        # 営業日の切り替えで本日分でなくなった行は削除されない
+        if self._timed('delete', lambda: self.store.apply(op)) and op['ids']:
+            self.deleted.append(store_name)
+
+    def rollover(self, clock, max_rollovers, rollover_scheduler):
+        if clock.advance(max_rollovers):
+            self._timed('rollover', rollover_scheduler.check)
+            if rollover_scheduler.error is not None:
+                raise rollover_scheduler.error
+        else:
+            self._timed('open', self.store.today_view)
+
+    def open(self):
+        self._timed('open', self.store.today_view)
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def _latency_table(values_by_kind):
+    return {
+        kind: {
+            'count': len(values),
+            'p50_ms': _percentile(values, 0.5) * 1000,
+            'p95_ms': _percentile(values, 0.95) * 1000,
+            'max_ms': max(values) * 1000,
+        }
+        for kind, values in values_by_kind.items()
+        if values
+    }
+
+
+def _stored_names():
+    """保存ファイルを読み直して、本日分 + 記録保持 + アーカイブの全件を店舗名で数える"""
+    if os.environ.get(storage.STORAGE_ENV, 'json').lower() == 'sqlite':
+        reloaded = storage.SqliteStore()
+    else:
+        reloaded = storage.JournalStore()
+    try:
+        stored = collections.Counter(entry['店舗名'] for entry in reloaded.daily_data)
+        for date in reloaded.saved_dates():
+            stored.update(entry['店舗名'] for entry in reloaded.saved_day(date))
+        archive = retention.Archive()
+        for date in archive.dates():
+            stored.update(entry['店舗名'] for entry in archive.day(date))
+    finally:
+        if hasattr(reloaded, 'close'):
+            reloaded.close()
+    return stored
+
+
+def _drive(workers, actions, seed, step):
+    """各端末をスレッドで同時に動かす（step(worker, kind, rng) で1操作）"""
+    start_barrier = threading.Barrier(len(workers))
+    kinds = list(ACTION_WEIGHTS)
+    weights = [ACTION_WEIGHTS[kind] for kind in kinds]
+
+    def drive(worker):
+        rng = random.Random(seed * 1000 + worker.number)
+        start_barrier.wait()
+        for _ in range(actions):
+            kind = rng.choices(kinds, weights)[0]
+            try:
+                step(worker, kind, rng)
+            except Exception as e:
+                worker.errors.append(f"{kind}: {e}")
+
+    threads = [threading.Thread(target=drive, args=(worker,)) for worker in workers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def _summarize(mode, workers, elapsed, write_stats, stored, clock):
+    added = [name for worker in workers for name in worker.added]
+    deleted = {name for worker in workers for name in worker.deleted}
+    expected = collections.Counter(name for name in added if name not in deleted)
+    lost = sorted(set(expected) - set(stored))
+    duplicated = sorted(name for name, count in stored.items() if count > expected.get(name, 0))
+
+    latencies = collections.defaultdict(list)
+    for worker in workers:
+        for kind, values in worker.latencies.items():
+            latencies[kind].extend(values)
+    waits = [wait for worker in workers for wait in worker.waits]
+    if waits:
+        latencies['(待ち)'] = waits
+    return {
+        'mode': mode,
+        'sessions': len(workers),
+        'elapsed': elapsed,
+        'latency': _latency_table(latencies),
+        'writes': write_stats,
+        'added': len(added),
+        'deleted': len(deleted),
+        'conflicts': sum(worker.conflicts for worker in workers),
+        'rollovers': clock.rollovers,
+        'stored': sum(stored.values()),
+        'lost': lost,
+        'duplicated': duplicated,
+        'errors': [error for worker in workers for error in worker.errors],
+    }
+
+
+class Sandbox:
+    """一時ディレクトリで動かし、営業日と RolloverScheduler の時計を FakeClock に差し替える"""
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='totalcash_load_')
+        self.cwd = os.getcwd()
+        self.original_current = business_date.current_business_date
+        self.original_scheduler = scheduler.RolloverScheduler
+        start = datetime.datetime.strptime(self.original_current(), business_date.DATE_FORMAT).date()
+        self.clock = FakeClock(start)
+
+    def __enter__(self):
+        os.chdir(self.directory)
+        business_date.current_business_date = self.clock.today
+        storage.current_business_date = self.clock.today
+        # main.py が作るスケジューラーも FakeClock の時刻で営業日を確かめる
+        scheduler.RolloverScheduler = functools.partial(self.original_scheduler, now=self.clock.now)
+        return self
+
+    def __exit__(self, *exc):
+        business_date.current_business_date = self.original_current
+        storage.current_business_date = self.original_current
+        scheduler.RolloverScheduler = self.original_scheduler
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return False
+
+
+def run_app_load(sessions=8, actions=20, max_rollovers=2, seed=0, timeout=60):
+    """AppTest で main.py を動かす負荷試験"""
+    opened = []
+    original_open = storage.open_store
+
+    def open_store():
+        store = original_open()
+        opened.append(store)
+        return store
+
+    with Sandbox() as sandbox:
+        clock = sandbox.clock
+        storage.open_store = open_store
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        try:
+            workers = [Session(n + 1, timeout) for n in range(sessions)]
+            for worker in workers:
+                worker.run('open')
+
+            def step(worker, kind, rng):
+                if kind == 'add':
+                    worker.add()
+                elif kind == 'delete':
+                    worker.delete(rng)
+                elif kind == 'rollover' and clock.advance(max_rollovers):
+                    # スケジューラーが切り替え、セッションは次の再実行で新しい営業日を表示する
+                    rollover_scheduler = RolloverScheduler(opened[0], now=clock.now)
+                    rollover_scheduler.check()
+                    if rollover_scheduler.error is not None:
+                        raise rollover_scheduler.error
+                    worker.run('rollover')
+                else:
+                    worker.run('open')
+
+            elapsed = _drive(workers, actions, seed, step)
+            shared = opened[0] if opened else None
+            write_stats = shared.commit_stats() if shared is not None else None
+            if shared is not None and hasattr(shared.backend, 'close'):
+                shared.backend.close()
+            stored = _stored_names()
+        finally:
+            storage.open_store = original_open
+            st.cache_resource.clear()
+    return _summarize('app', workers, elapsed, write_stats, stored, clock)
+
+
+def run_store_load(sessions=8, actions=20, max_rollovers=2, seed=0):
+    """共有データを N スレッドから同時に操作する負荷試験"""
+    with Sandbox() as sandbox:
+        clock = sandbox.clock
+        shared = storage.open_store()
+        rollover_scheduler = RolloverScheduler(shared, now=clock.now)
+        workers = [StoreWorker(n + 1, shared) for n in range(sessions)]
+
+        def step(worker, kind, rng):
+            if kind == 'add':
+                worker.add()
+            elif kind == 'delete':
+                worker.delete(rng)
+            elif kind == 'rollover':
+                worker.rollover(clock, max_rollovers, rollover_scheduler)
+            else:
+                worker.open()
+
+        elapsed = _drive(workers, actions, seed, step)
+        write_stats = shared.commit_stats()
+        if hasattr(shared.backend, 'close'):
+            shared.backend.close()
+        stored = _stored_names()
+    return _summarize('store', workers, elapsed, write_stats, stored, clock)
+
+
+def print_report(result):
+    print(f"[{result['mode']}] セッション数: {result['sessions']}  経過: {result['elapsed']:.1f}s"
+          f"  営業日の切り替え: {result['rollovers']}回")
+    print()
+    print_table(
+        [{'kind': kind, **values} for kind, values in sorted(result['latency'].items())],
+        [('kind', '操作'), ('count', '回数'), ('p50_ms', 'p50(ms)'), ('p95_ms', 'p95(ms)'), ('max_ms', '最大(ms)')],
+    )
+    print()
+    writes = result['writes']
+    if writes:
+        print(f"書き込み: {writes['commits']}回（操作 {writes['ops']}件, 1回あたり平均 {writes['avg']:.2f} / 最大 {writes['max']}件）"
+              f"  スナップショット: {writes['snapshots']}回")
+    print(f"追加: {result['added']}件  削除: {result['deleted']}件  チェックが外れた（他の端末の変更）: {result['conflicts']}回")
+    print(f"保存されている件数: {result['stored']}件  消えた: {len(result['lost'])}件  二重: {len(result['duplicated'])}件")
+    for name in result['lost'][:10]:
+        print(f"  消えた: {name}")
+    for name in result['duplicated'][:10]:
+        print(f"  二重: {name}")
+    for error in result['errors'][:10]:
+        print(f"  エラー: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同時入力の負荷試験")
+    parser.add_argument('--mode', choices=['app', 'store', 'both'], default='both',
+                        help="app: AppTest で画面ごと / store: 共有データを直接同時に操作")
+    parser.add_argument('--sessions', type=int, default=8, help="同時に動かすセッション数")
+    parser.add_argument('--actions', type=int, default=20, help="セッションごとの操作回数")
+    parser.add_argument('--rollovers', type=int, default=2, help="営業日を切り替える最大回数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="結果を JSON に保存")
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.mode in ('app', 'both'):
+        results.append(run_app_load(args.sessions, args.actions, args.rollovers, args.seed))
+    if args.mode in ('store', 'both'):
+        results.append(run_store_load(args.sessions, args.actions, args.rollovers, args.seed))
+    for n, result in enumerate(results):
+        if n:
+            print()
+        print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    failed = any(result['lost'] or result['duplicated'] or result['errors'] for result in results)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# benchmarks/parser_bench.py
+"""
+解析・保存・集計の測定
+  python -m benchmarks.parser_bench                     # 100 〜 100万行
+  python -m benchmarks.parser_bench --sizes 1k,10k --save result.json
+  python -m benchmarks.parser_bench --baseline result.json   # 前回より20%以上遅ければ失敗
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import talk_parser
+from aggregates import DailyTotals, day_summary
+from benchmarks.common import (
+    best_time, check_results, load_results, parse_sizes, print_table, save_results
+)
+from benchmarks.talk_history import store_money_lines, talk_history
+from day_table import ENTRY_ID, DayTable
+from storage import JournalStore
+
+DEFAULT_SIZES = '100,1k,10k,100k,1m'
+
+# 最低スループット（1秒あたりの行数・件数）。これを下回ったら失敗
+THRESHOLDS = {
+    'parse_money': 100000,
+    'tab2_extract': 150000,
+    'tab2_backfill': 100000,
+    'tab1_multiline': 100000,
+    'save': 20000,
+    'load': 50000,
+    # 集計には内容の解析（バック記号別の集計）も含むので、parse_money と同じ
+    'aggregate': 100000,
+}
+# しきい値で判定する最小の行数（これより小さいと、ファイルを開くなどの1回ごとの手間が大半になる）
+THRESHOLD_MIN_SIZE = 1000
+
+# 1回の追加でまとめて保存する件数（複数行入力1回分）
+ENTRIES_PER_ADD = 10
+
+
+def _parse_all(lines):
+    talk_parser._line_total.cache_clear()
+    return [talk_parser.parse_money(line) for line in lines]
+
+
+def _extract(lines, with_dates):
+    talk_parser._line_total.cache_clear()
+    return list(talk_parser.iter_talk_entries(lines, with_dates=with_dates))
+
+
+def _tab1_multiline(lines):
+    talk_parser._line_total.cache_clear()
+    pairs = talk_parser.pair_store_lines(lines)
+    return talk_parser.parse_money_many([line for _, line in pairs])['total']
+
+
+def _open(directory):
+    """
+    測定用の JournalStore
+    グループコミットの待ち時間（COMMIT_WINDOW）は測る時間に入れない（小さいサイズで結果がばらつくため）
+    """
+    return JournalStore(
+        snapshot_path=os.path.join(directory, 'app_data.json'),
+        journal_path=os.path.join(directory, 'app_data.journal'),
+        commit_window=0,
+    )
+
+
+def _save(entries, directory):
+    """ENTRIES_PER_ADD 件ずつ追加して、すべて書き込まれるまで"""
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    store = _open(directory)
+    for i in range(0, len(entries), ENTRIES_PER_ADD):
+        store.apply({'op': 'add', 'entries': entries[i:i + ENTRIES_PER_ADD]})
+    store.close()
+    return store
+
+
+def _load(directory):
+    store = _open(directory)
+    store.close()
+    return store
+
+
+def _aggregate(entries, table):
+    """起動時の集計（共有データと同じく、集計・読み込んだ DayTable の索引・日の集計）"""
+    totals = DailyTotals(entries)
+    index = table.group_index()
+    summary = day_summary(entries)
+    return totals, index, summary
+
+
+def run(sizes, only=None):
+    """各サイズで測定して結果の行を返す"""
+    rows = []
+    directory = tempfile.mkdtemp(prefix='totalcash_bench_')
+    try:
+        for size in sizes:
+            repeat = 3 if size <= 100000 else 1
+            lines = talk_history(size)
+            paste = store_money_lines(lines)
+            entries = [
+                {'時刻': '20:00', **entry} for entry in talk_parser.iter_talk_entries(lines)
+            ]
+            table = DayTable({**entry, ENTRY_ID: pos} for pos, entry in enumerate(entries))
+            cases = [
+                ('parse_money', len(lines), lambda: _parse_all(lines)),
+                ('tab2_extract', len(lines), lambda: _extract(lines, False)),
+                ('tab2_backfill', len(lines), lambda: _extract(lines, True)),
+                ('tab1_multiline', len(paste), lambda: _tab1_multiline(paste)),
+                ('save', len(entries), lambda: _save(entries, directory)),
+                ('load', len(entries), lambda: _load(directory)),
+                ('aggregate', len(entries), lambda: _aggregate(entries, table)),
+            ]
+            for name, units, func in cases:
+                if only and name not in only:
+                    continue
+                seconds, _ = best_time(func, repeat)
+                rows.append({
+                    'name': name,
+                    'size': size,
+                    'units': units,
+                    'seconds': seconds,
+                    'throughput': units / seconds if seconds > 0 else float('inf'),
+                })
+                print(f"  {name} {size:,}行: {seconds:.3f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="解析・保存・集計の測定")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="トーク履歴の行数（例: 100,1k,10k,100k,1m）")
+    parser.add_argument('--only', default='', help="測定する項目（カンマ区切り）: " + ', '.join(THRESHOLDS))
+    parser.add_argument('--baseline', help="前回の結果（--save で保存した JSON）")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="前回比で許す低下の割合")
+    parser.add_argument('--save', help="結果を JSON に保存")
+    args = parser.parse_args(argv)
+
+    only = {name.strip() for name in args.only.split(',') if name.strip()}
+    rows = run(parse_sizes(args.sizes), only)
+    baseline = load_results(args.baseline) if args.baseline else None
+    failures = check_results(rows, THRESHOLDS, baseline, args.tolerance, THRESHOLD_MIN_SIZE)
+    print_table(rows, [
+        ('name', '項目'), ('size', '行数'), ('units', '処理数'), ('seconds', '秒'),
+        ('throughput', '処理数/秒'), ('status', '判定'),
+    ])
+    if args.save:
+        save_results(args.save, rows)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
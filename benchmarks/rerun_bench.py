@@ -0,0 +1,305 @@
+# benchmarks/rerun_bench.py
+"""
+本日分の件数と再実行の重さ
+本日分に 100 〜 5万件（+ 記録保持の過去の日）を入れた状態で main.py を AppTest で動かし、
+よくある操作ごとに スクリプト全体の再実行時間・メモリのピーク・部分ごとの時間 を測る
+
+  python -m benchmarks.rerun_bench                        # 100, 1k, 10k, 50k 件
+  python -m benchmarks.rerun_bench --sizes 1k,10k --actions add,delete --save rerun.json
+
+部分ごとの時間は profiling.py の計測（section / profiled で囲んだ部分）を使う。
+大きいほうの2つの件数の間の増え方（両対数の傾き。1 なら件数に比例）が MAX_GROWTH を超える部分と、
+合計が RERUN_BUDGET_MS を超える操作を失敗とする
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import streamlit as st
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.testing.v1 import AppTest
+
+import business_date
+import profiling
+import retention
+import storage
+from benchmarks.common import parse_sizes, print_table, save_results
+from benchmarks.load_test import APP_PATH, DELETE_COLUMN, Sandbox
+from benchmarks.talk_history import talk_entries
+
+DEFAULT_SIZES = '100,1k,10k,50k'
+
+# 測る操作
+#   open:   何もせずに再実行（他の端末の更新を見るときなど）
+#   select: 一覧の削除チェックを1つ入れる
+#   delete: チェックした1件を削除する
+#   add:    1回毎入力で1件追加する
+#   toggle: 過去の記録の明細を開く
+ACTIONS = ['open', 'select', 'delete', 'add', 'toggle']
+
+# 記録保持している過去の日数（各日とも本日分と同じ件数）
+HISTORY_DAYS = retention.DEFAULT_HOT_DAYS
+
+# 件数に対する増え方の上限（両対数の傾き）。これを超える部分は件数に比例するより重くなっている
+# （件数が少ないうちは固定の処理が目立つので、大きいほうの2つの件数の間で判定する）
+MAX_GROWTH = 1.5
+# 増え方を判定する最小の時間（最大件数でこれより速い部分は誤差が大きいので判定しない）
+GROWTH_FLOOR_MS = 5.0
+
+# 操作1回の再実行時間の上限（件数ごと, ミリ秒）
+RERUN_BUDGET_MS = {
+    100: 400,
+    1000: 500,
+    10000: 1000,
+    50000: 3000,
+}
+
+# 合計の行の名前
+TOTAL = '(合計)'
+MEMORY = '(メモリ MB)'
+
+
+class Bench:
+    """1つの件数での測定（AppTest のセッション1つ）"""
+
+    def __init__(self, timeout):
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.history_date = None
+
+    def _last_profile(self):
+        """最後に完了した実行の計測（profile_log.jsonl の最後の 'run'）"""
+        with open(profiling.PROFILE_LOG, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        for line in reversed(lines):
+            record = json.loads(line)
+            if record['kind'] == 'run':
+                return record
+        return None
+
+    def _run(self, editor_state=None):
+        if editor_state is None:
+            self.app.run()
+        else:
+            states = self.app._tree.get_widget_states()
+            states.widgets.append(editor_state)
+            self.app._run(states)
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+    def _select_state(self):
+        editors = [frame for frame in self.app.dataframe if frame.key == 'data_editor']
+        return WidgetState(
+            id=editors[0].proto.id,
+            string_value=json.dumps(
+                {'edited_rows': {'0': {DELETE_COLUMN: True}}, 'added_rows': [], 'deleted_rows': []}
+            ),
+        )
+
+    def prepare(self, action):
+        """測る再実行の直前までの操作をして、測る再実行を返す"""
+        if action == 'open':
+            return lambda: self._run()
+        if action == 'select':
+            self._run()
+            state = self._select_state()
+            return lambda: self._run(state)
+        if action == 'delete':
+            self._run()
+            state = self._select_state()
+            self._run(state)
+            buttons = [button for button in self.app.button if button.label.startswith('🗑️ 選択した')]
+            buttons[0].click()
+            return lambda: self._run(state)
+        if action == 'add':
+            self._run()
+            self.app.text_input(key='single_user').input('測定')
+            self.app.text_area(key='combined_input').input('測定店\n1.1000')
+            self.app.button(key='add_single_talk').click()
+            return lambda: self._run()
+        if action == 'toggle':
+            self.app.toggle(key=f"show_{self.history_date}").set_value(False)
+            self._run()
+            self.app.toggle(key=f"show_{self.history_date}").set_value(True)
+            return lambda: self._run()
+        raise ValueError(f"不明な操作です: {action}")
+
+    def measure(self, action, repeat, memory):
+        """action を repeat 回測って最短の回の時間・部分ごとの時間と、メモリのピークを返す"""
+        best = None
+        for _ in range(max(1, repeat)):
+            rerun = self.prepare(action)
+            start = time.perf_counter()
+            rerun()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, self._last_profile())
+        peak = None
+        if memory:
+            rerun = self.prepare(action)
+            tracemalloc.start()
+            try:
+                rerun()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        elapsed, record = best
+        sections = {s['name']: s['ms'] for s in record['sections']} if record else {}
+        return elapsed * 1000, sections, peak
+
+
+def seed(size, history_days):
+    """本日分 size 件と、過去 history_days 日分（各 size 件）を保存する"""
+    entries = talk_entries(size)
+    today = datetime.datetime.strptime(business_date.current_business_date(), business_date.DATE_FORMAT)
+    days = {
+        (today - datetime.timedelta(days=n)).strftime(business_date.DATE_FORMAT): entries
+        for n in range(1, history_days + 1)
+    }
+    store = storage.open_store()
+    if days:
+        store.apply({'op': 'put_days', 'days': days})
+    store.apply({'op': 'add', 'entries': entries})
+    if hasattr(store.backend, 'close'):
+        store.backend.close()
+    return max(days) if days else None
+
+
+def run(sizes, actions, repeat=None, memory=True, history_days=HISTORY_DAYS, timeout=600):
+    """各件数・各操作を測って結果の行を返す"""
+    rows = []
+    opened = []
+    original_open = storage.open_store
+
+    def open_store():
+        store = original_open()
+        opened.append(store)
+        return store
+
+    os.environ[profiling.PROFILE_ENV] = '1'
+    try:
+        for size in sizes:
+            with Sandbox():
+                st.cache_resource.clear()
+                st.cache_data.clear()
+                history_date = seed(size, history_days)
+                storage.open_store = open_store
+                bench = Bench(timeout)
+                bench.history_date = history_date
+                # 最初の実行（データの読み込み）は測らない
+                bench._run()
+                for action in actions:
+                    if action == 'toggle' and history_date is None:
+                        continue
+                    times = repeat or (3 if size <= 10000 else 1)
+                    total_ms, sections, peak = bench.measure(action, times, memory)
+                    rows.append({
+                        'action': action,
+                        'size': size,
+                        'ms': total_ms,
+                        'peak_mb': peak / 1024 / 1024 if peak is not None else None,
+                        'sections': sections,
+                    })
+                    print(f"  {action} {size:,}件: {total_ms:,.0f}ms", file=sys.stderr)
+                storage.open_store = original_open
+                st.cache_resource.clear()
+                while opened:
+                    store = opened.pop()
+                    if hasattr(store.backend, 'close'):
+                        store.backend.close()
+    finally:
+        storage.open_store = original_open
+        os.environ.pop(profiling.PROFILE_ENV, None)
+    return rows
+
+
+def growth(points):
+    """[(件数, ミリ秒), ...] の両対数の傾き（件数に比例なら 1, 2乗に比例なら 2）"""
+    points = [(math.log(size), math.log(ms)) for size, ms in points if size > 0 and ms > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if var == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+def scaling_tables(rows):
+    """
+    操作ごとに 部分 × 件数 の表を作り、増え方と予算で判定する
+    戻り値: {操作: (表の行, 列)}, 失敗した項目のリスト
+    """
+    tables = {}
+    failures = []
+    for action in dict.fromkeys(row['action'] for row in rows):
+        measured = [row for row in rows if row['action'] == action]
+        sizes = [row['size'] for row in measured]
+        names = list(dict.fromkeys(name for row in measured for name in row['sections']))
+        lines = []
+        for name in [TOTAL, MEMORY] + names:
+            if name == TOTAL:
+                values = [row['ms'] for row in measured]
+            elif name == MEMORY:
+                values = [row['peak_mb'] for row in measured]
+            else:
+                values = [row['sections'].get(name) for row in measured]
+            line = {'name': name}
+            for size, value in zip(sizes, values):
+                line[size] = value
+            problems = []
+            if name != MEMORY:
+                points = [(size, value) for size, value in zip(sizes, values) if value is not None]
+                slope = growth(points[-2:])
+                line['growth'] = slope
+                largest = values[-1] or 0
+                if slope is not None and slope > MAX_GROWTH and largest >= GROWTH_FLOOR_MS:
+                    problems.append(f"増え方 {slope:.2f} > {MAX_GROWTH}")
+            if name == TOTAL:
+                for size, value in zip(sizes, values):
+                    budget = RERUN_BUDGET_MS.get(size)
+                    if budget is not None and value > budget:
+                        problems.append(f"{size:,}件 {value:,.0f}ms > {budget:,}ms")
+            line['status'] = 'NG ' + ', '.join(problems) if problems else ''
+            if problems:
+                failures.append((action, name, problems))
+            lines.append(line)
+        columns = [('name', '部分')] + [(size, f"{size:,}件") for size in sizes]
+        columns += [('growth', '増え方'), ('status', '判定')]
+        tables[action] = (lines, columns)
+    return tables, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本日分の件数と再実行の重さ")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="本日分の件数（例: 100,1k,10k,50k）")
+    parser.add_argument('--actions', default=','.join(ACTIONS), help="測る操作（カンマ区切り）: " + ', '.join(ACTIONS))
+    parser.add_argument('--repeat', type=int, help="1つの操作を測る回数（既定: 1万件までは3回、それより多いと1回）")
+    parser.add_argument('--history-days', type=int, default=HISTORY_DAYS, help="記録保持している過去の日数")
+    parser.add_argument('--no-memory', action='store_true', help="メモリのピークを測らない（tracemalloc で遅くなるため）")
+    parser.add_argument('--save', help="結果を JSON に保存")
+    args = parser.parse_args(argv)
+
+    actions = [action.strip() for action in args.actions.split(',') if action.strip()]
+    unknown = [action for action in actions if action not in ACTIONS]
+    if unknown:
+        parser.error(f"不明な操作です: {', '.join(unknown)}")
+    rows = run(parse_sizes(args.sizes), actions, args.repeat, not args.no_memory, args.history_days)
+    tables, failures = scaling_tables(rows)
+    for n, (action, (lines, columns)) in enumerate(tables.items()):
+        if n:
+            print()
+        print(f"[{action}]")
+        print_table(lines, columns)
+    if args.save:
+        save_results(args.save, rows)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# benchmarks/talk_history.py
+"""測定用の合成トーク履歴（LINE のトーク履歴エクスポートに似せた行）"""
+import datetime
+import itertools
+import random
+
+from talk_parser import BACK_VALUES, iter_talk_entries, parse_date_header
+
+# 投稿者・店舗名の候補
+USERS = ['田中', '佐藤', '鈴木', '高橋', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '吉田', '山田', 'りゅうせい', 'KAITO', 'ジン']
+STORES = ['ザクラブ🟢', 'クラブA', '店B', 'Lounge SEVEN', '姫', 'ルシファー', 'アクア', 'エース', '本店', '2号店']
+
+# 最終・追加以外の投稿（ブロックを閉じる雑談）
+CHATTER = ['お疲れ様です', '了解です！', '[スタンプ]', '[写真]', '本日もよろしくお願いします', '18時入りです', '電話 090-1234-5678']
+
+# 曜日（日付行用）
+_WEEKDAYS = '月火水木金土日'
+
+
+def money_line(rng):
+    """金額行を1つ作る（バック記号はすべての種類、時刻の混入や表記ゆれも含む）"""
+    people = rng.choice([1, 1, 1, 2, 2, 3, 4, 10])
+    price = rng.choice([0, 1000, 2000, 3000, 5000, 10000])
+    marker = rng.choice(list(BACK_VALUES) + [''])
+    kind = rng.random()
+    if kind < 0.6:
+        return f"{people}.{price}{marker}"
+    if kind < 0.7:
+        # 時刻が混入した行（'1.300019:21❤️'）
+        return f"{people}.{price}{rng.randint(18, 23)}:{rng.randint(10, 59)}{marker}"
+    if kind < 0.8:
+        # スペース入り（'1 .2000 ❤'）
+        return f"{people} .{price} {marker}"
+    if kind < 0.9:
+        # 末尾ドット（'2.' '1.3000.❤️'）
+        return f"{people}.{price}.{marker}" if price else f"{people}."
+    return f"{people}.{price}{marker} {rng.choice(['', '初回', '指名', '延長'])}"
+
+
+def iter_talk_history(n_lines, seed=0, start=datetime.date(2025, 8, 27), posts_per_day=400):
+    """
+    n_lines 行の合成トーク履歴を1行ずつ返す
+    日付行・投稿時刻・投稿者名・最終/追加の投稿（店舗名 + 金額行）・雑談を混ぜる
+    """
+    rng = random.Random(seed)
+    produced = 0
+    day = start
+    while True:
+        header = f"{day:%Y/%m/%d}({_WEEKDAYS[day.weekday()]})"
+        lines = [header]
+        minute = 18 * 60
+        for _ in range(posts_per_day):
+            minute += rng.randint(0, 3)
+            clock = "%02d:%02d" % (minute // 60 % 24, minute % 60)
+            user = rng.choice(USERS)
+            if rng.random() < 0.55:
+                lines.append(f"{clock}\t{user}\t{rng.choice(['最終', '追加', '最終です', '追加分'])}")
+                for _ in range(rng.randint(1, 4)):
+                    lines.append(rng.choice(STORES))
+                    for _ in range(rng.randint(1, 3)):
+                        lines.append(money_line(rng))
+                if rng.random() < 0.2:
+                    lines.append('')
+            else:
+                lines.append(f"{clock}\t{user}\t{rng.choice(CHATTER)}")
+                if rng.random() < 0.3:
+                    # 最終・追加ではない投稿に紛れた数字（抽出されない）
+                    lines.append(money_line(rng))
+        for line in lines:
+            yield line
+            produced += 1
+            if produced >= n_lines:
+                return
+        day += datetime.timedelta(days=1)
+
+
+def talk_history(n_lines, seed=0):
+    """n_lines 行の合成トーク履歴（行のリスト）"""
+    return list(iter_talk_history(n_lines, seed))
+
+
+def store_money_lines(lines):
+    """1回毎入力に貼り付ける部分（最終・追加の投稿の店舗名と金額行）だけを取り出す"""
+    return [line for line in lines if line and '\t' not in line and parse_date_header(line) is None]
+
+
+def talk_entries(n_entries, seed=0):
+    """n_entries 件の入力データ（合成トーク履歴から抽出し、投稿時刻を '時刻' にしたもの）"""
+    extracted = iter_talk_entries(iter_talk_history(float('inf'), seed), with_dates=True)
+    return [
+        {'時刻': entry['時刻'], '入力者': entry['入力者'], '店舗名': entry['店舗名'],
+         '内容': entry['内容'], '金額': entry['金額']}
+        for entry in itertools.islice(extracted, n_entries)
+    ]
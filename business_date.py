@@ -0,0 +1,29 @@
+# business_date.py
+"""営業日（朝7時区切り）の計算"""
+import datetime
+
+# 営業日の切り替え時刻（朝7時前は前日扱い）
+DAY_START_HOUR = 7
+
+# 営業日の文字列形式
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def business_date_of(moment):
+    """日時から営業日（'2025-08-27' 形式）を返す"""
+    if moment.hour < DAY_START_HOUR:
+        moment = moment - datetime.timedelta(days=1)
+    return moment.strftime(DATE_FORMAT)
+
+
+def current_business_date():
+    """現在の営業日を返す"""
+    return business_date_of(datetime.datetime.now())
+
+
+def next_day_start(moment):
+    """moment より後の最初の営業日の切り替え時刻（朝7時）"""
+    start = moment.replace(hour=DAY_START_HOUR, minute=0, second=0, microsecond=0)
+    if start <= moment:
+        start += datetime.timedelta(days=1)
+    return start
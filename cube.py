@@ -0,0 +1,217 @@
+# cube.py
+"""
+売上の集計キューブ（営業日 × 店舗名 × 入力者 ごとの 合計・件数）
+営業日の切り替え・記録の取り込みのたびに1日分ずつ更新し、
+分析タブ（週・月の合計、店舗ランキング、入力者の推移）はデータ本体を読まずにこれだけで集計する
+"""
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+# キューブの保存ファイル（1行1日の JSON Lines。同じ日は後の行が有効、'cells' が null の行はその日の削除）
+CUBE_FILE = 'app_data_cube.jsonl'
+# 行数が 日数の2倍 とこの値の大きいほうを超えたら、1日1行に書き直す（同じ日の記録保持を繰り返すと行が増えるため）
+COMPACT_MIN_LINES = 100
+
+# 集計の単位（画面の表示名 → pandas の期間）
+FREQUENCIES = {'週': 'W', '月': 'M'}
+
+# キューブの列
+COLUMNS = ['営業日', '店舗名', '入力者', '合計', '件数']
+
+
+def day_cells(entries):
+    """1日分のデータを 店舗名 × 入力者 ごとの [店舗名, 入力者, 合計, 件数] にまとめる"""
+    cells = {}
+    for entry in entries:
+        key = (entry['店舗名'], entry['入力者'])
+        total, count = cells.get(key, (0, 0))
+        cells[key] = (total + entry['金額'], count + 1)
+    return [[store, user, total, count] for (store, user), (total, count) in cells.items()]
+
+
+class SalesCube:
+    """
+    営業日ごとの集計セル（店舗名 × 入力者）
+    更新は1日分の行を追記するだけなので、すでにある日は書き直さない
+    古い行が溜まったら1日1行に書き直し、書き込み途中で落ちた末尾は読み込み時に切り捨てる
+    """
+
+    def __init__(self, path=CUBE_FILE):
+        self.path = path
+        self.version = 0          # 更新のたびに1つ増やす（表示用の DataFrame の作り直しに使う）
+        self.days = {}            # {営業日: [[店舗名, 入力者, 合計, 件数], ...]}
+        self._frame = None
+        self._frame_version = None
+        self._lines = 0           # ファイルの行数
+        self._load()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        end = 0
+        torn = False
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError(line)
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は捨てる
+                        torn = True
+                        break
+                    self._put_record(record)
+                    end += len(line)
+                    self._lines += 1
+        except FileNotFoundError:
+            return
+        if torn:
+            # 壊れた行の後ろに追記しないよう、読めたところまでで切り捨てる
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+        if self._too_long():
+            self._rewrite()
+
+    def _put_record(self, record):
+        if record['cells'] is None:
+            self.days.pop(record['business_date'], None)
+        else:
+            self.days[record['business_date']] = record['cells']
+
+    def _too_long(self):
+        return self._lines > max(len(self.days) * 2, COMPACT_MIN_LINES)
+
+    def _rewrite(self):
+        """今の内容を1日1行のファイルに書き直す（一時ファイルに書いてから置き換える）"""
+        text = ''.join(
+            json.dumps({'business_date': date, 'cells': self.days[date]}, ensure_ascii=False) + '\n'
+            for date in sorted(self.days)
+        )
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._lines = len(self.days)
+
+    def _append(self, records):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        for record in records:
+            self._put_record(record)
+        self._lines += len(records)
+        self.version += 1
+        if self._too_long():
+            self._rewrite()
+
+    def put_days(self, days):
+        """営業日ごとのデータ {営業日: データのリスト} の集計で置き換える"""
+        if days:
+            self._append([{'business_date': date, 'cells': day_cells(entries)} for date, entries in days.items()])
+
+    def put_day(self, date, entries):
+        self.put_days({date: entries})
+
+    def remove_day(self, date):
+        if date in self.days:
+            self._append([{'business_date': date, 'cells': None}])
+
+    def dates(self):
+        """集計のある営業日（新しい順）"""
+        return sorted(self.days, reverse=True)
+
+    def frame(self):
+        """
+        キューブ全体の DataFrame（営業日は datetime64、店舗名・入力者は category）
+        版が変わったときだけ作り直す
+        """
+        if self._frame_version != self.version or self._frame is None:
+            dates = sorted(self.days)
+            cells = [cell for date in dates for cell in self.days[date]]
+            # 営業日は日ごとに1回だけ変換して、セルの数だけ繰り返す
+            day_values = pd.to_datetime(pd.Series(dates, dtype=object), format='%Y-%m-%d')
+            self._frame = pd.DataFrame({
+                '営業日': day_values.repeat([len(self.days[date]) for date in dates]).to_numpy(),
+                '店舗名': pd.Categorical([cell[0] for cell in cells]),
+                '入力者': pd.Categorical([cell[1] for cell in cells]),
+                '合計': pd.array([cell[2] for cell in cells], dtype='int64'),
+                '件数': pd.array([cell[3] for cell in cells], dtype='int64'),
+            }, columns=COLUMNS)
+            self._frame_version = self.version
+        return self._frame
+
+
+def _periods(frame, freq):
+    """各行の期間（週は月曜始まり）"""
+    return frame['営業日'].dt.to_period('W-SUN' if freq == 'W' else freq)
+
+
+def period_label(period):
+    """期間の表示名（週: '2025-08-25〜'、月: '2025-08'）"""
+    if period.freqstr.startswith('W'):
+        return period.start_time.strftime('%Y-%m-%d') + '〜'
+    return str(period)
+
+
+def period_totals(frame, freq):
+    """期間ごとの 日数・合計・件数（古い順）"""
+    periods = _periods(frame, freq)
+    grouped = frame.groupby(periods)
+    result = pd.DataFrame({
+        '日数': grouped['営業日'].nunique(),
+        '合計': grouped['合計'].sum(),
+        '件数': grouped['件数'].sum(),
+    })
+    result.index = [period_label(period) for period in result.index]
+    result.index.name = '期間'
+    return result.reset_index()
+
+
+def period_list(frame, freq):
+    """キューブにある期間（pandas の Period、新しい順）"""
+    return sorted(_periods(frame, freq).unique(), reverse=True)
+
+
+def store_ranking(frame, period=None):
+    """
+    店舗別の 合計・件数・日数（合計の多い順、順位付き）
+    period（period_list の1つ）を指定するとその期間だけ
+    """
+    if period is not None:
+        frame = frame[frame['営業日'].between(period.start_time, period.end_time)]
+    grouped = frame.groupby('店舗名', observed=True, dropna=False)
+    result = pd.DataFrame({
+        '合計': grouped['合計'].sum(),
+        '件数': grouped['件数'].sum(),
+        '日数': grouped['営業日'].nunique(),
+    }).sort_values(['合計', '件数'], ascending=False, kind='stable').reset_index()
+    result.insert(0, '順位', range(1, len(result) + 1))
+    return result
+
+
+def user_trend(frame, freq):
+    """入力者ごとの期間別の合計（行: 期間（古い順）, 列: 入力者）"""
+    periods = _periods(frame, freq)
+    trend = frame.pivot_table(
+        index=periods, columns='入力者', values='合計', aggfunc='sum', fill_value=0, observed=True
+    )
+    trend.index = [period_label(period) for period in trend.index]
+    trend.index.name = '期間'
+    trend.columns = list(trend.columns)
+    return trend
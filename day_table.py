@@ -0,0 +1,236 @@
+# day_table.py
+"""
+本日データの列指向の保存（1件ごとの辞書の代わり）
+  - 入力者・店舗名・内容: 名前の一覧 + 番号の配列（pandas の Categorical と同じ形）
+  - 時刻: 0:00 からの分（'HH:MM' の一覧の番号として持つので、そのまま Categorical になる）
+  - 金額・ID: int64 の配列
+配列は追加のたびに伸ばし、表示用の DataFrame はコピーせずに配列をそのまま使う
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+# データごとの ID（追加時に保存方式が付ける。削除は ID で指定する）
+ENTRY_ID = 'id'
+# 列の順（pd.DataFrame(辞書のリスト) と同じ並び + ID）
+COLUMNS = ['時刻', '入力者', '店舗名', '内容', '金額', ENTRY_ID]
+# 配列の初期の大きさ（足りなくなったら2倍にする）
+INITIAL_CAPACITY = 256
+# 時刻の一覧（番号 = 0:00 からの分）。'HH:MM' 以外の時刻はこの後ろに追加する
+MINUTE_LABELS = ['%02d:%02d' % (minute // 60, minute % 60) for minute in range(24 * 60)]
+
+
+def _code_dtype(size):
+    """名前の数に応じた番号の型（pandas の Categorical が使う型と同じにしてコピーを避ける）"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _grow(array, needed):
+    """needed 件入る配列（足りなければ2倍ずつ大きくした新しい配列）"""
+    if needed <= len(array):
+        return array
+    capacity = max(len(array), INITIAL_CAPACITY)
+    while capacity < needed:
+        capacity *= 2
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class _CodedColumn:
+    """名前の一覧 + 番号の配列で持つ列（同じ名前は1回だけ保存する）"""
+
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self.lookup = {label: code for code, label in enumerate(self.labels)}
+        self.codes = np.empty(0, dtype=_code_dtype(len(self.labels)))
+        self._dtype = None
+
+    def code(self, label):
+        """名前の番号（初めての名前は一覧に追加する。None は -1 = 欠損）"""
+        if label is None:
+            return -1
+        code = self.lookup.get(label)
+        if code is None:
+            code = self.lookup[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def put(self, start, codes):
+        """start 件目から codes を書き込む（番号の型が足りなくなったら新しい配列にする）"""
+        dtype = _code_dtype(len(self.labels))
+        if self.codes.dtype != dtype:
+            self.codes = self.codes.astype(dtype)
+        self.codes = _grow(self.codes, start + len(codes))
+        self.codes[start:start + len(codes)] = codes
+
+    def categorical(self, size):
+        """先頭 size 件の Categorical（番号の配列はコピーしない）"""
+        if self._dtype is None or len(self._dtype.categories) != len(self.labels):
+            self._dtype = pd.CategoricalDtype(pd.Index(self.labels, dtype=object))
+        return pd.Categorical.from_codes(self.codes[:size], dtype=self._dtype, validate=False)
+
+    def label(self, code):
+        return self.labels[code] if code >= 0 else None
+
+    def label_list(self, size):
+        labels = self.labels
+        return [labels[code] if code >= 0 else None for code in self.codes[:size].tolist()]
+
+
+class DayTable:
+    """
+    1日分のデータ（追加順）
+    削除は ID の印（tombstone）を付けるだけで、詰め直しは次に読むときにまとめて行う
+    ID は追加順に大きくなるので、ID から行は二分探索で見つける
+    読むだけの処理も詰め直しで配列を入れ替えるので、すべての処理を表のロックの中で行う
+    （画面の表示と書き込みスレッドのまとめ直しは、保存方式の別々のロックから同時に読む）
+    """
+
+    def __init__(self, entries=()):
+        self.size = 0                                    # 削除の印が付いた行も含む件数
+        self.ids = np.empty(0, dtype=np.int64)
+        self.amounts = np.empty(0, dtype=np.int64)
+        self.times = _CodedColumn(MINUTE_LABELS)
+        self.users = _CodedColumn()
+        self.stores = _CodedColumn()
+        self.contents = _CodedColumn()
+        self.deleted = set()                             # 削除の印が付いた行
+        self._lock = threading.RLock()
+        self.extend(entries)
+
+    def __len__(self):
+        with self._lock:
+            return self.size - len(self.deleted)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def extend(self, entries):
+        """データ（'id' 付きの辞書）を末尾に追加する"""
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            self._extend(entries)
+
+    def _extend(self, entries):
+        start = self.size
+        end = start + len(entries)
+        ids = [entry[ENTRY_ID] for entry in entries]
+        if ids != sorted(ids) or (start and ids[0] <= self.ids[start - 1]):
+            raise ValueError("ID は追加順に大きくなる必要があります")
+        self.ids = _grow(self.ids, end)
+        self.ids[start:end] = ids
+        self.amounts = _grow(self.amounts, end)
+        self.amounts[start:end] = [entry['金額'] for entry in entries]
+        for column, key in (
+            (self.times, '時刻'), (self.users, '入力者'), (self.stores, '店舗名'), (self.contents, '内容')
+        ):
+            column.put(start, [column.code(entry.get(key)) for entry in entries])
+        self.size = end
+
+    def _rows(self, ids):
+        """ID → 行（削除済み・存在しない ID は除く）"""
+        ids = np.fromiter(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids[:self.size], ids)
+        inside = rows < self.size
+        rows = rows[inside]
+        rows = rows[self.ids[rows] == ids[inside]]
+        return [row for row in rows.tolist() if row not in self.deleted]
+
+    def find(self, ids):
+        """ids のデータ（辞書のリスト。もう無い ID は除く）"""
+        with self._lock:
+            return [self._entry(row) for row in self._rows(ids)]
+
+    def delete(self, ids):
+        """ids に削除の印を付ける（戻り値: 削除した件数）"""
+        with self._lock:
+            rows = self._rows(dict.fromkeys(ids))
+            self.deleted.update(rows)
+            return len(rows)
+
+    def ids_at(self, positions):
+        """表示順の位置 → ID（以前のジャーナルの位置指定の削除を再生するため）"""
+        with self._lock:
+            self._compact()
+            return [int(self.ids[pos]) for pos in positions if pos < self.size]
+
+    def compact(self):
+        """
+        削除の印が付いた行を取り除いた新しい配列にする
+        これまでに渡した DataFrame は古い配列を見ているので影響を受けない
+        """
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        if not self.deleted:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[list(self.deleted)] = False
+        self.ids = self.ids[:self.size][keep]
+        self.amounts = self.amounts[:self.size][keep]
+        for column in (self.times, self.users, self.stores, self.contents):
+            column.codes = column.codes[:self.size][keep]
+        self.size = len(self.ids)
+        self.deleted = set()
+
+    def _entry(self, row):
+        return {
+            '時刻': self.times.label(self.times.codes[row]),
+            '入力者': self.users.label(self.users.codes[row]),
+            '店舗名': self.stores.label(self.stores.codes[row]),
+            '内容': self.contents.label(self.contents.codes[row]),
+            '金額': int(self.amounts[row]),
+            ENTRY_ID: int(self.ids[row]),
+        }
+
+    def entries(self):
+        """データを辞書のリストにする（保存・CSV・Excel 用）"""
+        with self._lock:
+            self._compact()
+            size = self.size
+            columns = zip(
+                self.times.label_list(size), self.users.label_list(size), self.stores.label_list(size),
+                self.contents.label_list(size), self.amounts[:size].tolist(), self.ids[:size].tolist()
+            )
+            return [dict(zip(COLUMNS, values)) for values in columns]
+
+    def to_frame(self):
+        """
+        表示用の DataFrame（配列をコピーせずに使う）
+        入力者・店舗名・内容・時刻は category 型、金額・ID は int64
+        """
+        with self._lock:
+            self._compact()
+            size = self.size
+            return pd.DataFrame(
+                {
+                    '時刻': self.times.categorical(size),
+                    '入力者': self.users.categorical(size),
+                    '店舗名': self.stores.categorical(size),
+                    '内容': self.contents.categorical(size),
+                    '金額': self.amounts[:size],
+                    ENTRY_ID: self.ids[:size],
+                },
+                copy=False
+            )
+
+    def group_index(self):
+        """
+        入力者 → 店舗名 → 行番号（to_frame の行番号）のリスト
+        入力者・店舗は最初に出てきた順に並ぶ
+        """
+        with self._lock:
+            self._compact()
+            pairs = zip(self.users.label_list(self.size), self.stores.label_list(self.size))
+            index = {}
+            for pos, (user, store) in enumerate(pairs):
+                index.setdefault(user, {}).setdefault(store, []).append(pos)
+            return index
@@ -0,0 +1,77 @@
+# exports.py
+"""ダウンロード用ファイルの作成（CSV / Excel）"""
+import io
+import re
+
+import pandas as pd
+from openpyxl import Workbook
+
+# Excel の各シートの列
+EXPORT_COLUMNS = ['営業日', '時刻', '入力者', '店舗名', '内容', '金額']
+
+# シート名に使えない文字と長さの上限（Excel の制限）
+_SHEET_INVALID_RE = re.compile(r'[\[\]:*?/\\]')
+SHEET_TITLE_MAX = 31
+
+
+def csv_bytes(entries):
+    """
+    データを CSV にする（Excel・Googleシートで文字化けしないよう BOM 付き UTF-8。内部の ID 列は出さない）
+    entries: データのリスト、または DataFrame
+    """
+    df = entries if isinstance(entries, pd.DataFrame) else pd.DataFrame(entries)
+    df = df.drop(columns=['id'], errors='ignore')
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def _sheet_title(name, used):
+    """Excel で使えるシート名にする（重複したら末尾に番号を付ける）"""
+    base = _SHEET_INVALID_RE.sub('_', str(name)).strip() or '_'
+    title = base[:SHEET_TITLE_MAX]
+    number = 2
+    while title.lower() in used:
+        suffix = f"~{number}"
+        title = base[:SHEET_TITLE_MAX - len(suffix)] + suffix
+        number += 1
+    used.add(title.lower())
+    return title
+
+
+def build_workbook(days):
+    """
+    期間のデータを Excel ブックにする
+    openpyxl の書き込み専用モードで1行ずつ書き出すので、書き出し中のブックはメモリをほとんど使わない
+    シートは 営業日ごと → 店舗ごと → 入力者ごと の順
+    days: {営業日: その日のデータのリスト}（読み込み済みのもの。ファイルは読まない）
+    戻り値: xlsx ファイルのバイト列
+    """
+    dates = sorted(days)
+
+    # 1回目: シートを先に並べるため、店舗と入力者を集める（最初に出てきた順）
+    stores = {}
+    users = {}
+    for date in dates:
+        for entry in days[date]:
+            stores.setdefault(entry['店舗名'], None)
+            users.setdefault(entry['入力者'], None)
+
+    workbook = Workbook(write_only=True)
+    used = set()
+    day_sheets = {date: workbook.create_sheet(_sheet_title(date, used)) for date in dates}
+    store_sheets = {store: workbook.create_sheet(_sheet_title(f"店舗_{store}", used)) for store in stores}
+    user_sheets = {user: workbook.create_sheet(_sheet_title(f"入力者_{user}", used)) for user in users}
+    for sheet in [*day_sheets.values(), *store_sheets.values(), *user_sheets.values()]:
+        sheet.append(EXPORT_COLUMNS)
+
+    # 2回目: 1日ずつ、日・店舗・入力者のシートに書き出す
+    for date in dates:
+        day_sheet = day_sheets[date]
+        for entry in days[date]:
+            row = [date, entry['時刻'], entry['入力者'], entry['店舗名'], entry['内容'], entry['金額']]
+            day_sheet.append(row)
+            store_sheets[entry['店舗名']].append(row)
+            user_sheets[entry['入力者']].append(row)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
@@ -3,110 +3,97 @@ import streamlit as st
 import re
 import pandas as pd
 import datetime
-import json
-import os
-
-# バック金額定義
-BACK_VALUES = {
-    '❤': 5000,
-    '❤️': 5000,
-    '♥': 5000,  # 白いハート追加
-    '⭕': 4000,
-    '⭕️': 4000,
-    'S': 3000,
-    's': 3000,  # 小文字のsも追加
-    '🔺': 3000,  # 🔺記号を追加
-    'B': 1000,  # Bバック追加
-    'b': 1000,  # 小文字のbも追加
-    '⭐️6': 9000,
-    '⭐️7': 10000,
-    '⭐️8': 11000,
-    '⭐️9': 12000,
-    '⭐️10': 13000,
-    '⭐6': 9000,
-    '⭐7': 10000,
-    '⭐8': 11000,
-    '⭐9': 12000,
-    '⭐10': 13000,
-    'E': 2000,  # Eバック
-    'e': 2000,   # 小文字のeも追加
-    '🟢': 0,     # 🟢記号を追加（バック無し）
-}
-
-def parse_money(line):
-    """
-    line: '2.2000S' や '1.1000 ❤' や '1 .2000❤️' や '1.300019:21❤️' や '1.0❤️' のような文字列
-    戻り値: 合計金額（人数 × 単価 + バック × 人数）
-    """
-    # 時間パターン（19:21など）を除去
-    line_without_time = re.sub(r'\d{1,2}:\d{2}', '', line)
-    
-    # 金額部分を抽出（スペースを考慮、より柔軟に）
-    # パターン1: 1.3000 (通常)
-    # パターン2: 1 .3000 (スペースあり)
-    # パターン3: 2.1000. (末尾にドット)
-    # パターン4: 1.0 (小数点以下0)
-    # パターン5: 2.3000.S (末尾にドット+記号)
-    
-    # まず数字の部分を抽出（より柔軟に）
-    money_patterns = [
-        r'(\d+)\s*\.\s*(\d+)',  # 基本パターン: 1.3000
-        r'(\d+)\s*\.\s*(\d*)\s*\.',  # 末尾ドットパターン: 2.1000.
-        r'(\d+)\s*\.\s*(\d*)'   # より一般的なパターン
-    ]
-    
-    m = None
-    for pattern in money_patterns:
-        m = re.search(pattern, line_without_time)
-        if m:
-            break
-    
-    if not m:
-        return 0
-    
-    count = int(m.group(1))
-    unit_str = m.group(2) if m.group(2) else '0'
-    unit = int(unit_str) if unit_str else 0
-    back_total = 0
-    
-    # 絵文字の柔軟なマッチング（元のlineでチェック）
-    # スペースを除去してからチェックしてマッチングの精度を向上
-    line_for_emoji_check = line.replace(' ', '')
-    for key, val in BACK_VALUES.items():
-        if key in line_for_emoji_check:
-            back_total += val * count
-            break  # 最初にマッチしたもので処理を終了（重複を避ける）
-    
-    return count * unit + back_total
+import html
+
+from aggregates import day_summary, store_totals
+from business_date import DATE_FORMAT
+from cube import FREQUENCIES, period_label, period_list, period_totals, store_ranking, user_trend
+from exports import build_workbook, csv_bytes
+from profiling import profiled, section, start_profile
+from scheduler import RolloverScheduler
+from storage import ENTRY_ID, open_store
+from talk_parser import (
+    back_rows, back_stats, iter_file_lines, iter_talk_entries, pair_store_lines, parse_money, parse_money_many
+)
 
 # データ永続化のための関数
-def save_data_to_file():
-    """データをJSONファイルに保存"""
-    data = {
-        'today_date': st.session_state.get('today_date', ''),
-        'daily_data': st.session_state.get('daily_data', []),
-        'saved_daily_data': st.session_state.get('saved_daily_data', {})
-    }
+@st.cache_resource
+def shared_data_store():
+    """全セッション共通のデータ（プロセスで1回だけ読み込み）"""
+    return open_store()
+
+def open_data_store():
+    """保存データを取得（JSON ジャーナル または SQLite）"""
     try:
-        with open('app_data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        return shared_data_store()
     except Exception as e:
+        # 読み込めないまま上書きしないよう、ここで止める
+        st.error(f"データ読み込みエラー: {e}")
+        st.stop()
+
+@st.cache_resource
+def rollover_scheduler(store_id, _data_store):
+    """
+    営業日の切り替えの予約（共有データごとに1つ。朝7時に全セッション分を1回だけ切り替える）
+    store_id: 共有データが作り直されたときに別のスケジューラーにするため
+    """
+    return RolloverScheduler(_data_store).start()
+
+def record(op):
+    """
+    操作をデータに反映して保存（ジャーナルに1行追記）
+    戻り値: 反映したら True
+    """
+    try:
+        return open_data_store().apply(op)
+    except OSError as e:
         st.error(f"データ保存エラー: {e}")
+        return False
 
-def load_data_from_file():
-    """JSONファイルからデータを読み込み"""
-    if os.path.exists('app_data.json'):
-        try:
-            with open('app_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data
-        except Exception as e:
-            st.error(f"データ読み込みエラー: {e}")
-            return None
-    return None
+@st.cache_data(max_entries=4, show_spinner=False)
+def today_csv(data_version, today_date, _frame):
+    """本日分の CSV（データの版ごとに1回だけ作る）"""
+    return csv_bytes(_frame)
+
+def data_changed(message=None):
+    """
+    保存データを変更したあとの更新（フラグメントの中からでもアプリ全体を再実行する）
+    message: 再実行後に表示する完了メッセージ
+    """
+    if message:
+        st.session_state.flash_message = message
+    st.rerun()
+
+def backfill_saved_days(days):
+    """
+    営業日ごとのデータを記録保持データに取り込む（全日分を1回の書き込みで保存）
+    days: {営業日: [データ, ...]}（その日の記録をまとめて置き換える）
+    本日分と営業日が不明（None）のデータは取り込まない
+    戻り値: 取り込んだ営業日のリスト
+    """
+    today_date = open_data_store().today_date
+    loaded_dates = sorted(d for d in days if d is not None and d != today_date)
+    if loaded_dates:
+        record({'op': 'put_days', 'days': {date: days[date] for date in loaded_dates}})
+    return loaded_dates
+
+def user_detail_html(store_groups):
+    """
+    入力者1人分の店舗ごとの内容を1つのHTMLにまとめる（行ごとに要素を作らない）
+    store_groups: [(店舗名, [内容, ...]), ...]
+    """
+    parts = []
+    for store, contents in store_groups:
+        parts.append(f'<div class="user-store">🏪 {html.escape(str(store))}</div>')
+        parts.extend(f'<div class="user-row">{html.escape(str(content))}</div>' for content in contents)
+    return ''.join(parts)
+
+# 計測（?profile=1 または TOTALCASH_PROFILE=1 のときだけ）
+profile = start_profile()
 
 # スマホ最適化 + コンパクトUIのためのCSS
-st.markdown("""
+with section("CSS・タイトル"):
+    st.markdown("""
 <style>
     /* 全体的な余白を削減 */
     .main .block-container {
@@ -192,6 +179,26 @@ st.markdown("""
         margin: 2px;
     }
 
+    /* 入力者毎の詳細（店舗見出しと内容の行） */
+    .user-store {
+        background-color: #f8f9fa;
+        border-left: 4px solid #0066cc;
+        padding: 8px 12px;
+        margin: 8px 0 4px 0;
+        border-radius: 4px;
+        font-weight: bold;
+        font-size: 14px;
+    }
+    .user-row {
+        background-color: white;
+        border: 1px solid #e9ecef;
+        padding: 6px 12px;
+        margin: 2px 0;
+        border-radius: 3px;
+        font-size: 13px;
+        line-height: 1.2;
+    }
+
     /* 区切り線の余白削減 */
     hr {
         margin-top: 0.8rem;
@@ -219,87 +226,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-st.title("💰 トーク履歴集計アプリ")
+    st.title("💰 トーク履歴集計アプリ")
 
 # タブで機能を分割（スマホ優先で1回毎入力を最初に）
-tab1, tab2 = st.tabs(["📱 1回毎入力", "📋 一括履歴"])
-
-with tab1:
-    st.subheader("📱 1回毎のトーク入力・累積")
-    
-    # セッション状態の初期化（ファイルからデータを読み込み）
-    if 'data_loaded' not in st.session_state:
-        # アプリ起動時にデータを読み込み
-        saved_data = load_data_from_file()
-        if saved_data:
-            st.session_state.today_date = saved_data.get('today_date', '')
-            st.session_state.daily_data = saved_data.get('daily_data', [])
-            st.session_state.saved_daily_data = saved_data.get('saved_daily_data', {})
-        else:
-            # ファイルがない場合は初期値を設定
-            st.session_state.daily_data = []
-            now_init = datetime.datetime.now()
-            if now_init.hour < 7:
-                st.session_state.today_date = (now_init - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-            else:
-                st.session_state.today_date = now_init.strftime("%Y-%m-%d")
-            st.session_state.saved_daily_data = {}
-        
-        st.session_state.data_loaded = True
-    
-    # 追加の初期化チェック
-    if 'daily_data' not in st.session_state:
-        st.session_state.daily_data = []
-    if 'today_date' not in st.session_state:
-        now_init = datetime.datetime.now()
-        if now_init.hour < 7:
-            st.session_state.today_date = (now_init - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        else:
-            st.session_state.today_date = now_init.strftime("%Y-%m-%d")
-    if 'saved_daily_data' not in st.session_state:
-        st.session_state.saved_daily_data = {}
-    
-    # 朝7時を基準にした日付管理
-    now = datetime.datetime.now()
-    # 朝7時前の場合は前日扱い
-    if now.hour < 7:
-        business_date = (now - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-    else:
-        business_date = now.strftime("%Y-%m-%d")
-    
-    # 営業日が変わったら新しい日として扱う
-    if business_date != st.session_state.today_date:
-        # 前日のデータを保存
-        if st.session_state.daily_data:
-            st.session_state.saved_daily_data[st.session_state.today_date] = st.session_state.daily_data.copy()
-        
-        # 3日より古いデータを自動削除
-        def cleanup_old_data():
-            current_date = datetime.datetime.strptime(business_date, "%Y-%m-%d")
-            cutoff_date = current_date - datetime.timedelta(days=3)
-            
-            dates_to_remove = []
-            for saved_date in st.session_state.saved_daily_data.keys():
-                saved_datetime = datetime.datetime.strptime(saved_date, "%Y-%m-%d")
-                if saved_datetime < cutoff_date:
-                    dates_to_remove.append(saved_date)
-            
-            for date_to_remove in dates_to_remove:
-                del st.session_state.saved_daily_data[date_to_remove]
-            
-            return len(dates_to_remove)
-        
-        # 古いデータのクリーンアップ実行
-        cleaned_count = cleanup_old_data()
-        
-        # 新しい日の開始
-        st.session_state.today_date = business_date
-        st.session_state.daily_data = []
-        # 営業日変更を保存
-        save_data_to_file()
-    
+tab1, tab2, tab3 = st.tabs(["📱 1回毎入力", "📋 一括履歴", "📈 分析"])
 
-    
+# タブ1は部分ごとにフラグメントにして、操作した部分だけを再実行する
+# データを変更したら data_changed() で全体を再実行し、データを表示している部分をすべて更新する
+@st.fragment
+@profiled("入力フォーム")
+def input_form():
+    """1回毎の入力フォーム（入力中の再実行はフォームだけ）"""
     # 1回毎の入力フォーム（スマホ最適化）
     st.write("**📝 データ入力**")
     
@@ -337,62 +274,37 @@ with tab1:
                     "金額": money
                 }
                 
-                # データを累積に追加
-                st.session_state.daily_data.append(entry)
-                # データを自動保存
-                save_data_to_file()
-                st.success(f"✅ 追加しました: {user_name} - {store_name} - {money:,}円")
+                # データを累積に追加して自動保存
+                if record({'op': 'add', 'entries': [entry]}):
+                    data_changed(f"✅ 追加しました: {user_name} - {store_name} - {money:,}円")
             
             elif len(lines) > 2:
                 # 複数ペアの連続入力
                 st.info("複数行データを処理中...")
-                entries_added = 0
-                
-                # 金額パターン
-                money_patterns = [
-                    r'\d+\s*\.\s*\d+',
-                    r'\d+\s*\.\s*\d*\s*\.',
-                    r'\d+\s*\.\s*\d*'
+
+                # (店舗名, 金額行) のペアを集める
+                # （金額行でない行を店舗名とし、連続する金額は同一店舗）
+                pairs = pair_store_lines(lines)
+
+                # 金額はまとめて解析
+                totals = parse_money_many([line for _, line in pairs])['total']
+                now_str = datetime.datetime.now().strftime("%H:%M")
+                entries = [
+                    {
+                        "時刻": now_str,
+                        "入力者": user_name,
+                        "店舗名": store,
+                        "内容": line,
+                        "金額": money
+                    }
+                    for (store, line), money in zip(pairs, totals)
                 ]
-                
-                i = 0
-                current_store = None
-                
-                while i < len(lines):
-                    line = lines[i].strip()
-                    if not line:
-                        i += 1
-                        continue
-                    
-                    # 現在行が金額行かチェック
-                    is_money_line = any(re.search(pattern, line) for pattern in money_patterns)
-                    
-                    if is_money_line:
-                        # 金額行の場合
-                        if current_store:
-                            # 店舗名がある場合、データを作成
-                            money = parse_money(line)
-                            
-                            entry = {
-                                "時刻": datetime.datetime.now().strftime("%H:%M"),
-                                "入力者": user_name,
-                                "店舗名": current_store,
-                                "内容": line,
-                                "金額": money
-                            }
-                            
-                            st.session_state.daily_data.append(entry)
-                            entries_added += 1
-                        # current_storeはそのまま維持（連続する金額は同一店舗）
-                    else:
-                        # 金額行でない場合は店舗名として設定
-                        current_store = line
-                    
-                    i += 1
-                
+                entries_added = len(entries)
+
                 if entries_added > 0:
-                    save_data_to_file()
-                    st.success(f"✅ {entries_added}件のデータを追加しました")
+                    # まとめて1回で保存
+                    if record({'op': 'add', 'entries': entries}):
+                        data_changed(f"✅ {entries_added}件のデータを追加しました")
                 else:
                     st.warning("有効なデータペアが見つかりませんでした。")
                 
@@ -431,28 +343,35 @@ with tab1:
                         "金額": money
                     }
                     
-                    # データを累積に追加
-                    st.session_state.daily_data.append(entry)
-                    # データを自動保存
-                    save_data_to_file()
-                    st.success(f"✅ 追加しました: {user_name} - {store_name} - {money:,}円")
+                    # データを累積に追加して自動保存
+                    if record({'op': 'add', 'entries': [entry]}):
+                        data_changed(f"✅ 追加しました: {user_name} - {store_name} - {money:,}円")
                 else:
                     st.warning("金額部分が認識できませんでした。2行に分けて入力してください。")
             else:
                 st.warning("入力データを確認してください。")
         else:
             st.warning("入力者名と店舗名・金額データを入力してください")
+
+
+@st.fragment
+@profiled("本日の一覧")
+def today_list():
+    """本日の累積データの一覧と削除（チェック操作の再実行は一覧だけ）"""
+    # 今日の累積データ
+    data_store = open_data_store()
+    today_view = data_store.today_view()
+    # 列指向の本日データをコピーせずに使う DataFrame
+    df_today = today_view['frame']
+    today_totals = today_view['totals']
     
     # 今日の累積データ表示（スマホ最適化）
-    if st.session_state.daily_data:
-        st.subheader(f"📅 本日の累積データ ({st.session_state.today_date})")
-        
-        # データフレーム表示（見やすく整理）
-        df_today = pd.DataFrame(st.session_state.daily_data)
+    if len(df_today) > 0:
+        st.subheader(f"📅 本日の累積データ ({today_view['today_date']})")
         
-        # 今日の合計を先に表示
-        total_today = df_today['金額'].sum()
-        data_count = len(st.session_state.daily_data)
+        # 今日の合計を先に表示（追加・削除のたびに更新している集計から）
+        total_today = today_totals['total']
+        data_count = today_totals['count']
         
         col1, col2 = st.columns(2)
         with col1:
@@ -464,189 +383,182 @@ with tab1:
         st.subheader("📋 データ一覧")
         
         # データを表示（セル内削除ボタン付きエディタ）
-        if len(st.session_state.daily_data) > 0:
-            # データエディタ用のデータフレーム作成
-            editor_df = df_today[['時刻', '入力者', '店舗名', '金額', '内容']].copy()
-            editor_df['金額'] = editor_df['金額'].apply(lambda x: f"{x:,}円")
-            
-            # 削除用の列を追加
-            editor_df['🗑️ 削除'] = False  # チェックボックス列
+        if len(df_today) > 0:
+            # データエディタ用のデータフレーム作成（行の見出しはデータの ID。表示はしない）
+            with section("本日の一覧: DataFrame作成"):
+                editor_df = df_today[['時刻', '入力者', '店舗名', '金額', '内容']].set_index(df_today[ENTRY_ID])
+                editor_df['金額'] = editor_df['金額'].map('{:,}円'.format)
+                
+                # 削除用の列を追加
+                editor_df['🗑️ 削除'] = False  # チェックボックス列
             
             # データエディタ（セル内インタラクション可能）
-            edited_df = st.data_editor(
-                editor_df,
-                use_container_width=True,
-                hide_index=True,
-                height=300,
-                column_config={
-                    "時刻": st.column_config.TextColumn("🕐 時刻", disabled=True),
-                    "入力者": st.column_config.TextColumn("👤 入力者", disabled=True),
-                    "店舗名": st.column_config.TextColumn("🏪 店舗名", disabled=True),
-                    "金額": st.column_config.TextColumn("💰 金額", disabled=True),
-                    "内容": st.column_config.TextColumn("📝 内容", disabled=True),
-                    "🗑️ 削除": st.column_config.CheckboxColumn(
-                        "🗑️ 削除",
-                        help="削除する行にチェックを入れてください",
-                        default=False,
-                        width="small"
-                    )
-                },
-                key="data_editor"
-            )
+            with section("本日の一覧: data_editor"):
+                edited_df = st.data_editor(
+                    editor_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    height=300,
+                    column_config={
+                        "時刻": st.column_config.TextColumn("🕐 時刻", disabled=True),
+                        "入力者": st.column_config.TextColumn("👤 入力者", disabled=True),
+                        "店舗名": st.column_config.TextColumn("🏪 店舗名", disabled=True),
+                        "金額": st.column_config.TextColumn("💰 金額", disabled=True),
+                        "内容": st.column_config.TextColumn("📝 内容", disabled=True),
+                        "🗑️ 削除": st.column_config.CheckboxColumn(
+                            "🗑️ 削除",
+                            help="削除する行にチェックを入れてください",
+                            default=False,
+                            width="small"
+                        )
+                    },
+                    key="data_editor"
+                )
             
             # 削除処理
             if edited_df is not None:
-                # 削除にチェックが入った行を特定
-                delete_indices = edited_df[edited_df['🗑️ 削除'] == True].index.tolist()
+                # 削除にチェックが入った行の ID
+                delete_ids = edited_df[edited_df['🗑️ 削除'] == True].index.tolist()
                 
-                if delete_indices:
-                    # 削除確認
-                    if st.button(f"🗑️ 選択した{len(delete_indices)}件を削除", type="primary"):
-                        # 逆順で削除（インデックスがずれないように）
-                        for idx in sorted(delete_indices, reverse=True):
-                            if idx < len(st.session_state.daily_data):
-                                st.session_state.daily_data.pop(idx)
-                        
-                        save_data_to_file()
-                        st.success(f"{len(delete_indices)}件のデータを削除しました")
-                        st.rerun()
+                if delete_ids:
+                    # 削除確認（ID で削除するので、他の端末で一覧が変わっていても選んだ行だけが消える）
+                    if st.button(f"🗑️ 選択した{len(delete_ids)}件を削除", type="primary"):
+                        op = {'op': 'delete', 'ids': [int(entry_id) for entry_id in delete_ids]}
+                        if record(op):
+                            # 他の端末で先に削除された・営業日が切り替わった行は数えない
+                            data_changed(f"{len(op['ids'])}件のデータを削除しました")
             
             # 使い方説明
             st.info("💡 **使い方**: 削除したい行の「🗑️ 削除」列にチェックを入れて、削除ボタンをクリックしてください")
         else:
             st.info("まだデータがありません。")
+
+
+@st.fragment
+@profiled("集計・入力者毎の詳細")
+def today_summary():
+    """本日の店舗別合計・バック内訳・入力者毎の詳細・データ管理"""
+    data_store = open_data_store()
+    today_view = data_store.today_view()
+    data_version = today_view['version']
+    df_today = today_view['frame']
+    today_totals = today_view['totals']
+    group_index = today_view['group_index']
+    if len(df_today) == 0:
+        return
+    # 内容の列（行番号 = 索引の行番号）
+    contents = df_today['内容'].tolist()
+    
+    # 店舗別集計
+    store_summary = pd.DataFrame(store_totals(today_totals['by_store']))
+    st.subheader("🏪 店舗別合計")
+    st.dataframe(store_summary, use_container_width=True, hide_index=True)
+
+    # バック記号ごとの内訳（追加・削除のたびに差分で集計済み）
+    back_summary = back_rows(today_totals['by_back'])
+    if back_summary:
+        st.subheader("🎯 バック内訳")
+        st.dataframe(pd.DataFrame(back_summary), use_container_width=True, hide_index=True)
+    
+    # 入力者毎の店舗集計（タブ化）
+    st.subheader("👤 入力者毎の詳細")
+    
+    # 入力者（最初に入力した順）
+    users = list(group_index)
+    
+    with section("入力者毎の詳細"):
+        if len(users) > 0:
+            # タブを作成
+            user_tabs = st.tabs([f"👤 {user}" for user in users])
         
-        # 店舗別集計
-        if not df_today.empty:
-            store_summary = df_today.groupby('店舗名')['金額'].sum().reset_index()
-            store_summary = store_summary.sort_values('金額', ascending=False)
-            st.subheader("🏪 店舗別合計")
-            st.dataframe(store_summary, use_container_width=True, hide_index=True)
-            
-            # 入力者毎の店舗集計（タブ化）
-            st.subheader("👤 入力者毎の詳細")
-            
-            # ユニークな入力者を取得
-            users = df_today['入力者'].unique()
-            
-            if len(users) > 0:
-                # タブを作成
-                user_tabs = st.tabs([f"👤 {user}" for user in users])
-                
-                for i, user in enumerate(users):
-                    with user_tabs[i]:
-                        # その入力者のデータをフィルタ
-                        user_data = df_today[df_today['入力者'] == user]
-                        
-                        st.write(f"**{user}さんの入力内容**")
-                        
-                        # 店舗ごとにグループ化してコンパクト表示
-                        stores = user_data['店舗名'].unique()
-                        
-                        for store in stores:
-                            # 各店舗のデータをフィルタ
-                            store_data = user_data[user_data['店舗名'] == store]
-                            
-                            # カスタムCSSでコンパクトな表示
-                            st.markdown(f"""
-                            <div style="
-                                background-color: #f8f9fa; 
-                                border-left: 4px solid #0066cc; 
-                                padding: 8px 12px; 
-                                margin: 8px 0 4px 0; 
-                                border-radius: 4px;
-                                font-weight: bold;
-                                font-size: 14px;
-                            ">
-                                🏪 {store}
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            # その店舗の内容を一行ずつコンパクトに表示
-                            for _, row in store_data.iterrows():
-                                st.markdown(f"""
-                                <div style="
-                                    background-color: white;
-                                    border: 1px solid #e9ecef;
-                                    padding: 6px 12px;
-                                    margin: 2px 0;
-                                    border-radius: 3px;
-                                    font-size: 13px;
-                                    line-height: 1.2;
-                                ">
-                                    {row['内容']}
-                                </div>
-                                """, unsafe_allow_html=True)
-        
-        # データ管理機能
-        st.markdown("---")
-        st.subheader("📊 データ管理")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("📄 Googleシート形式でダウンロード", key="download_csv", use_container_width=True):
-                # CSV形式でダウンロード
-                csv_data = df_today.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="💾 CSVファイルをダウンロード",
-                    data=csv_data,
-                    file_name=f"daily_data_{st.session_state.today_date}.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
-        
-        with col2:
-            if st.button("💾 今日分を記録保持", key="save_daily", use_container_width=True):
-                # 今日のデータを保存済みデータに追加
-                st.session_state.saved_daily_data[st.session_state.today_date] = st.session_state.daily_data.copy()
-                # データを自動保存
-                save_data_to_file()
-                st.success(f"✅ {st.session_state.today_date} のデータを記録保持しました")
+            for i, user in enumerate(users):
+                with user_tabs[i]:
+                    # 店舗ごとにグループ化して、1つの要素にまとめて表示
+                    store_groups = [
+                        (store, [contents[pos] for pos in positions])
+                        for store, positions in group_index[user].items()
+                    ]
+                    st.markdown(
+                        f"**{html.escape(str(user))}さんの入力内容**\n\n" + user_detail_html(store_groups),
+                        unsafe_allow_html=True
+                    )
+    
+    # データ管理機能
+    st.markdown("---")
+    st.subheader("📊 データ管理")
     
+    col1, col2 = st.columns(2)
+    with col1:
+        # CSV形式でダウンロード（データが変わったときだけ作り直す）
+        st.download_button(
+            label="📄 Googleシート形式でダウンロード",
+            data=today_csv(data_version, today_view['today_date'], df_today),
+            file_name=f"daily_data_{today_view['today_date']}.csv",
+            mime="text/csv",
+            key="download_csv",
+            use_container_width=True
+        )
+    
+    with col2:
+        if st.button("💾 今日分を記録保持", key="save_daily", use_container_width=True):
+            # 今日のデータを保存済みデータに追加して自動保存（過去の記録の表示も更新）
+            if record({'op': 'save_day'}):
+                data_changed(f"✅ {today_view['today_date']} のデータを記録保持しました")
+
+
+@st.fragment
+@profiled("過去の記録")
+def history():
+    """過去2日間の記録"""
+    data_store = open_data_store()
     # 過去2日間の記録表示
-    if st.session_state.saved_daily_data:
+    # 保存されているデータの日付（新しい順）
+    saved_dates = data_store.saved_dates()
+    if saved_dates:
         st.markdown("---")
         st.subheader("📚 過去2日間の記録")
         
-        # 保存されているデータを日付順でソート（新しい順）
-        saved_dates = list(st.session_state.saved_daily_data.keys())
-        saved_dates.sort(reverse=True)
-        
         # 過去2日間のデータのみ表示
         recent_dates = saved_dates[:2]
         
         if recent_dates:
             for date in recent_dates:
-                past_data = st.session_state.saved_daily_data[date]
-                df_past = pd.DataFrame(past_data)
+                # 見出しと合計は保存済みの集計から（明細は表示したときだけ読み込む）
+                summary = data_store.saved_summary(date) or day_summary([])
                 
-                with st.expander(f"📅 {date} の記録 ({len(past_data)}件)", expanded=False):
-                    if not df_past.empty:
+                with st.expander(f"📅 {date} の記録 ({summary['件数']}件)", expanded=False):
+                    if summary['件数']:
                         # 合計金額
-                        total_past = df_past['金額'].sum()
-                        st.metric("💰 その日の総合計", f"{total_past:,}円")
+                        st.metric("💰 その日の総合計", f"{summary['合計']:,}円")
                         
-                        # データ表示（インデックス非表示）
-                        st.dataframe(df_past, use_container_width=True, hide_index=True)
+                        # 店舗別合計
+                        past_stores = sorted(summary['店舗別'].items(), key=lambda item: item[1], reverse=True)
+                        st.dataframe(
+                            pd.DataFrame(past_stores, columns=['店舗名', '金額']),
+                            use_container_width=True,
+                            hide_index=True
+                        )
                         
-                        # ダウンロード機能
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            csv_past = df_past.to_csv(index=False, encoding='utf-8-sig')
+                        # 明細とCSVは開いたときだけ作る
+                        if st.toggle("📋 明細を表示・CSVダウンロード", key=f"show_{date}"):
+                            past_data = data_store.saved_day(date)
+                            df_past = pd.DataFrame(past_data).drop(columns=[ENTRY_ID], errors='ignore')
+                            
+                            # データ表示（インデックス非表示）
+                            st.dataframe(df_past, use_container_width=True, hide_index=True)
+                            
                             st.download_button(
                                 label=f"📄 {date} CSVダウンロード",
-                                data=csv_past,
+                                data=csv_bytes(past_data),
                                 file_name=f"daily_data_{date}.csv",
                                 mime="text/csv",
                                 key=f"download_{date}",
                                 use_container_width=True
                             )
                         
-                        with col2:
-                            if st.button(f"🗑️ {date}の記録を削除", key=f"delete_{date}", use_container_width=True):
-                                del st.session_state.saved_daily_data[date]
-                                save_data_to_file()
-                                st.rerun()
+                        if st.button(f"🗑️ {date}の記録を削除", key=f"delete_{date}", use_container_width=True):
+                            if record({'op': 'delete_day', 'date': date}):
+                                data_changed()
                     else:
                         st.info("データがありません")
         else:
@@ -654,62 +566,221 @@ with tab1:
     else:
         st.info("まだデータがありません。上記からデータを入力してください。")
 
-with tab2:
+
+# Excel ファイルの MIME タイプ
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+@st.fragment
+@profiled("Excel出力")
+def export_workbook():
+    """期間を指定して Excel に出力（営業日ごと・店舗ごと・入力者ごとのシート）"""
+    data_store = open_data_store()
+    today_view = data_store.today_view()
+    today_date = today_view['today_date']
+    # 記録保持の日だけでなくアーカイブした日も出力できる（月ごとの出力など）
+    dates = [date for date in data_store.past_dates() if date != today_date]
+    if len(today_view['frame']) > 0:
+        dates.append(today_date)
+    if not dates:
+        return
+    
+    st.markdown("---")
+    st.subheader("📦 期間をまとめてExcel出力")
+    
+    first_date = datetime.datetime.strptime(min(dates), DATE_FORMAT).date()
+    last_date = datetime.datetime.strptime(max(dates), DATE_FORMAT).date()
+    date_range = st.date_input(
+        "期間",
+        value=(first_date, last_date),
+        min_value=first_date,
+        max_value=last_date,
+        key="export_range"
+    )
+    if len(date_range) != 2:
+        st.info("開始日と終了日を選んでください")
+        return
+    
+    start, end = (d.strftime(DATE_FORMAT) for d in date_range)
+    selected = sorted(date for date in dates if start <= date <= end)
+    st.caption(f"{len(selected)}日分（日ごと・店舗ごと・入力者ごとのシート）")
+    
+    # 作成済みのファイルは期間とデータの版が同じあいだだけ使う
+    export_key = (tuple(selected), today_view['version'])
+    if st.button("📊 Excelファイルを作成", key="build_xlsx", disabled=not selected, use_container_width=True):
+        def load_days():
+            # 過去の日はまとめて読む（アーカイブの月のファイルは1回ずつ）
+            days = data_store.past_days([date for date in selected if date != today_date])
+            if today_date in selected:
+                days[today_date] = data_store.daily_data
+            return days
+        
+        try:
+            with st.spinner("Excelファイルを作成中..."):
+                st.session_state.export_xlsx = (export_key, build_workbook(load_days()))
+        except OSError as e:
+            st.error(f"Excel作成エラー: {e}")
+    
+    built = st.session_state.get('export_xlsx')
+    if built and built[0] == export_key:
+        st.download_button(
+            label="💾 Excelファイルをダウンロード",
+            data=built[1],
+            file_name=f"totalcash_{start}_{end}.xlsx",
+            mime=XLSX_MIME,
+            key="download_xlsx",
+            use_container_width=True
+        )
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def analytics_tables(cube_version, freq, _cube_frame):
+    """期間ごとの合計・入力者ごとの推移・期間の一覧（キューブの版ごとに1回だけ作る）"""
+    return period_totals(_cube_frame, freq), user_trend(_cube_frame, freq), period_list(_cube_frame, freq)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def ranking_table(cube_version, period_name, _cube_frame, _period):
+    """店舗ランキング（キューブの版・期間ごとに1回だけ作る）"""
+    return store_ranking(_cube_frame, _period)
+
+@st.fragment
+@profiled("分析")
+def analytics():
+    """記録した日の集計（週・月の合計、店舗ランキング、入力者の推移）"""
+    data_store = open_data_store()
+    # 集計キューブ（営業日 × 店舗名 × 入力者）だけを使い、記録の明細は読まない
+    cube_view = data_store.cube_view()
+    cube_frame = cube_view['frame'] if cube_view else None
+    if cube_frame is None or cube_frame.empty:
+        st.info("まだ集計できる記録がありません（記録保持した日・営業日が切り替わった日が集計されます）")
+        return
+    
+    first_date = cube_frame['営業日'].iloc[0].strftime(DATE_FORMAT)
+    last_date = cube_frame['営業日'].iloc[-1].strftime(DATE_FORMAT)
+    st.caption(f"{first_date} 〜 {last_date}（{cube_frame['営業日'].nunique()}日分）")
+    
+    unit = st.radio("集計の単位", list(FREQUENCIES), horizontal=True, key="analytics_unit")
+    freq = FREQUENCIES[unit]
+    # グラフは作るのが重いので、表示したときだけ作る
+    show_charts = st.toggle("📊 グラフを表示", key="analytics_charts")
+    totals, trend, period_options = analytics_tables(cube_view['version'], freq, cube_frame)
+    
+    # 期間ごとの合計
+    st.subheader(f"📅 {unit}ごとの合計")
+    if show_charts:
+        st.bar_chart(totals.set_index('期間')['合計'])
+    totals_view = totals.iloc[::-1].copy()
+    totals_view['合計'] = totals_view['合計'].map('{:,}円'.format)
+    st.dataframe(totals_view, use_container_width=True, hide_index=True)
+    
+    # 店舗ランキング
+    st.subheader("🏆 店舗ランキング")
+    period = st.selectbox(
+        "期間", [None] + period_options, key=f"ranking_{freq}",
+        format_func=lambda period: "全期間" if period is None else period_label(period)
+    )
+    ranking = ranking_table(cube_view['version'], str(period), cube_frame, period).copy()
+    ranking['合計'] = ranking['合計'].map('{:,}円'.format)
+    st.dataframe(ranking, use_container_width=True, hide_index=True)
+    
+    # 入力者ごとの推移
+    st.subheader(f"👤 入力者ごとの{unit}別合計")
+    if show_charts:
+        st.line_chart(trend)
+    st.dataframe(trend.iloc[::-1].apply(lambda column: column.map('{:,}円'.format)), use_container_width=True)
+
+with tab1:
+    st.subheader("📱 1回毎のトーク入力・累積")
+    
+    # 保存データ（全セッション共通）
+    with section("データ読み込み"):
+        data_store = open_data_store()
+        scheduler = rollover_scheduler(id(data_store), data_store)
+    
+    # 朝7時を基準にした営業日の切り替えはスケジューラーのスレッドが行う
+    # （前日のデータを保存し、記録保持の期間を過ぎた日はアーカイブへ移す。全セッションで1回だけ）
+    # 各セッションは共有データの版が変わったことで新しい営業日を表示する
+    if scheduler.error is not None:
+        st.error(f"データ保存エラー: {scheduler.error}")
+    
+    # 前回の操作の結果（データ変更後の再実行で表示）
+    flash_message = st.session_state.pop('flash_message', None)
+    if flash_message:
+        st.success(flash_message)
+    
+    input_form()
+    today_list()
+    today_summary()
+    history()
+    export_workbook()
+
+with tab2, section("一括履歴"):
     st.subheader("📋 一括トーク履歴処理")
+    # ファイルアップロード（大きなトーク履歴はこちら）
+    uploaded_file = st.file_uploader("トーク履歴ファイル（.txt）をアップロード", type=["txt"], key="talk_file")
     # テキスト入力
     text_input = st.text_area("一日分のトーク履歴をここに貼り付けてください", height=400)
     
+    # 複数日分の履歴は営業日ごとに振り分けて記録に取り込む
+    backfill_mode = st.checkbox(
+        "📅 複数日の履歴を営業日ごとに記録へ取り込む",
+        key="backfill_mode",
+        help="日付行と投稿時刻から営業日（朝7時前は前日扱い）を判定し、日ごとの記録に保存します"
+    )
+    
     if st.button("抽出＆集計"):
-        if not text_input.strip():
-            st.warning("テキストを入力してください")
+        main_data = None
+        source = None
+        if uploaded_file is not None:
+            # ファイルをチャンク単位で読みながら抽出（全体を文字列にしない）
+            uploaded_file.seek(0)
+            source = iter_file_lines(uploaded_file)
+        elif not text_input.strip():
+            st.warning("テキストを入力するか、ファイルをアップロードしてください")
         else:
-            lines = text_input.splitlines()
-            pattern = re.compile(r'最終|追加')
-            indices = [i for i, line in enumerate(lines) if pattern.search(line)]
-            
-            # メインデータ（最終・追加）
+            source = text_input.splitlines()
+        
+        if source is not None:
+            if uploaded_file is not None:
+                progress = st.progress(0.0, text="📥 読み込み中...")
+                partial_total = st.empty()
+                file_size = max(uploaded_file.size, 1)
+            last_pos = 0
+            running_total = 0
+            # メインデータ（最終・追加）: 履歴を1回だけ走査して抽出
             main_data = []
+            # 取り込み用: 営業日 → その日の記録
+            days = {}
+            for entry in iter_talk_entries(source, with_dates=backfill_mode):
+                main_data.append(entry)
+                running_total += entry['金額']
+                if backfill_mode:
+                    days.setdefault(entry['営業日'], []).append({
+                        "時刻": entry['時刻'],
+                        "入力者": entry['入力者'],
+                        "店舗名": entry['店舗名'],
+                        "内容": entry['内容'],
+                        "金額": entry['金額']
+                    })
+                if uploaded_file is not None:
+                    # 新しいチャンクを読み込んだら進捗と途中集計を更新
+                    pos = uploaded_file.tell()
+                    if pos != last_pos:
+                        last_pos = pos
+                        progress.progress(min(pos / file_size, 1.0), text=f"📥 読み込み中... {pos:,} / {file_size:,} バイト")
+                        partial_total.write(f"途中集計: {len(main_data):,}件 / {running_total:,}円")
+            if uploaded_file is not None:
+                progress.progress(1.0, text="✅ 読み込み完了")
+                partial_total.empty()
             
-            # 最終・追加のパターンを処理
-            for i in indices:
-                # 名前を抽出（最終・追加を含む行から）
-                trigger_line = lines[i]
-                name_match = re.search(r'\d{1,2}:\d{2}\s+(.+?)\s+.*(?:最終|追加)', trigger_line)
-                current_user = name_match.group(1).strip() if name_match else "不明ユーザー"
-                
-                j = i + 1
-                current_store = None
-                while j < len(lines) and not re.match(r'\d{1,2}:\d{2}', lines[j]):
-                    line = lines[j].strip()
-                    
-                    # 金額行の判定
-                    line_without_time = re.sub(r'\d{1,2}:\d{2}', '', line)
-                    money_patterns = [
-                        r'\d+\s*\.\s*\d+',
-                        r'\d+\s*\.\s*\d*\s*\.',
-                        r'\d+\s*\.\s*\d*'
-                    ]
-                    is_money_line = any(re.search(pattern, line_without_time) for pattern in money_patterns)
-                    
-                    if is_money_line:
-                        if current_store:
-                            money = parse_money(line)
-                            main_data.append({
-                                "入力者": current_user,
-                                "店舗名": current_store, 
-                                "内容": line, 
-                                "金額": money
-                            })
-                    
-                    # 店舗名行の判定
-                    elif line:
-                        if j + 1 < len(lines):
-                            next_line_without_time = re.sub(r'\d{1,2}:\d{2}', '', lines[j + 1])
-                            next_is_money = any(re.search(pattern, next_line_without_time) for pattern in money_patterns)
-                            if next_is_money:
-                                current_store = line
-                    j += 1
-            
+            if backfill_mode:
+                loaded_dates = backfill_saved_days(days)
+                if loaded_dates:
+                    st.success(f"✅ {len(loaded_dates)}日分を記録に取り込みました: {', '.join(loaded_dates)}")
+                if None in days:
+                    st.warning(f"日付行より前の{len(days[None])}件は営業日が不明のため取り込みませんでした")
+                if data_store.today_date in days:
+                    st.info(f"本日（{data_store.today_date}）分は1回毎入力で管理しているため取り込みませんでした")
+        
+        if main_data is not None:
             # DataFrame に変換
             df = pd.DataFrame(main_data)
             
@@ -726,7 +797,20 @@ with tab2:
                 st.subheader("🏪 店舗ごとの合計金額")
                 st.dataframe(store_sum, hide_index=True)
 
+                # バック記号ごとの内訳
+                back_summary = back_stats(df['内容'])
+                if back_summary:
+                    st.subheader("🎯 バック内訳")
+                    st.dataframe(pd.DataFrame(back_summary), hide_index=True)
+
                 st.subheader("💰 全体合計金額")
                 st.write(f"**{df['金額'].sum():,}円**")
             else:
                 st.warning("メイン集計データがありません")
+
+with tab3:
+    st.subheader("📈 分析")
+    analytics()
+
+# 計測結果（有効なときだけ表示・記録）
+profile.finish()
@@ -0,0 +1,163 @@
+# profiling.py
+"""画面表示の計測（?profile=1 または TOTALCASH_PROFILE=1 のときだけ有効）"""
+import contextlib
+import datetime
+import functools
+import json
+import os
+import time
+
+import streamlit as st
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    get_script_run_ctx = None
+
+# 計測を有効にする環境変数とクエリパラメータ
+PROFILE_ENV = 'TOTALCASH_PROFILE'
+PROFILE_PARAM = 'profile'
+# 計測結果の追記先（1回の実行が1行の JSON Lines）
+PROFILE_LOG = 'profile_log.jsonl'
+# セッションごとの計測（フラグメントだけの再実行でも同じものを使う）
+_STATE_KEY = '_run_profile'
+
+
+def profiling_enabled():
+    """計測が有効か（環境変数 または URL の ?profile=1）"""
+    if os.environ.get(PROFILE_ENV, '') not in ('', '0'):
+        return True
+    try:
+        return st.query_params.get(PROFILE_PARAM, '') not in ('', '0')
+    except Exception:
+        return False
+
+
+class RunProfile:
+    """
+    1回の実行の計測
+    section(名前) で囲んだ部分ごとに 時間・送信した要素数・送信量（バイト）を記録する
+    要素数と送信量は、Streamlit が画面に送るメッセージを数えて求める
+    """
+
+    def __init__(self, log_path=PROFILE_LOG):
+        self.log_path = log_path
+        self.sections = []
+        self.elements = 0
+        self.payload = 0
+        self.started = time.perf_counter()
+        self.finished = False
+
+    def count(self, msg):
+        """画面に送るメッセージ1件を数える"""
+        if msg.HasField('delta'):
+            self.elements += 1
+            self.payload += msg.ByteSize()
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """囲んだ部分を計測する"""
+        start = time.perf_counter()
+        elements = self.elements
+        payload = self.payload
+        try:
+            yield
+        finally:
+            record = {
+                'name': name,
+                'ms': round((time.perf_counter() - start) * 1000, 2),
+                'elements': self.elements - elements,
+                'bytes': self.payload - payload,
+            }
+            if self.finished:
+                # フラグメントだけの再実行（全体の計測は終わっている）はその部分だけ記録する
+                self._write('fragment', [record], record['ms'], record['elements'], record['bytes'])
+            else:
+                self.sections.append(record)
+
+    def finish(self):
+        """全体の計測を終えてログに追記し、内訳を表示する"""
+        total_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        self.finished = True
+        self._write('run', self.sections, total_ms, self.elements, self.payload)
+        with st.expander(f"⏱️ 計測: {total_ms:,.0f}ms / {self.elements}要素 / {self.payload / 1024:,.1f}KB"):
+            st.dataframe(
+                [
+                    {'部分': s['name'], '時間(ms)': s['ms'], '要素数': s['elements'], '送信量(KB)': round(s['bytes'] / 1024, 1)}
+                    for s in self.sections
+                ],
+                use_container_width=True,
+                hide_index=True
+            )
+
+    def _write(self, kind, sections, total_ms, elements, payload):
+        record = {
+            'at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'kind': kind,
+            'ms': total_ms,
+            'elements': elements,
+            'bytes': payload,
+            'sections': sections,
+        }
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError:
+            # 計測ログが書けなくても画面表示は続ける
+            pass
+
+
+class _NoProfile:
+    """計測しないとき（section はそのまま実行するだけ）"""
+
+    def section(self, name):
+        return contextlib.nullcontext()
+
+    def finish(self):
+        pass
+
+
+def _set_counter(profile):
+    """画面に送るメッセージを profile で数えるようにする（None で元に戻す）"""
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+    enqueue = getattr(ctx, '_enqueue', None)
+    if enqueue is None:
+        return
+    original = getattr(enqueue, 'original', enqueue)
+    if profile is None:
+        ctx._enqueue = original
+        return
+
+    def counting_enqueue(msg):
+        profile.count(msg)
+        original(msg)
+
+    counting_enqueue.original = original
+    ctx._enqueue = counting_enqueue
+
+
+_NO_PROFILE = _NoProfile()
+
+
+def start_profile():
+    """この実行の計測を始める（無効なら何もしない計測を返す）"""
+    profile = RunProfile() if profiling_enabled() else _NO_PROFILE
+    _set_counter(profile if profile is not _NO_PROFILE else None)
+    st.session_state[_STATE_KEY] = profile
+    return profile
+
+
+def section(name):
+    """このセッションの計測で、囲んだ部分を name として計測する"""
+    return st.session_state.get(_STATE_KEY, _NO_PROFILE).section(name)
+
+
+def profiled(name):
+    """関数全体を name として計測するデコレータ（フラグメントにも使える）"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with section(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
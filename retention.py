@@ -0,0 +1,214 @@
+# retention.py
+"""
+記録保持の期間（直近の日だけをすぐ見られる状態に置く）とアーカイブ
+  - 直近 hot_days 日より古い記録保持の日は、営業日の切り替えのたびにアーカイブへ移す
+  - アーカイブ: 月ごとの gzip 圧縮 JSON Lines（1行 = 1日分のデータと集計）+ 日ごとの集計の一覧
+営業日は 'YYYY-MM-DD' なので、文字列の大小で日付の前後を比べる
+"""
+import datetime
+import gzip
+import json
+import os
+import zlib
+
+from aggregates import day_summary
+from business_date import DATE_FORMAT
+
+# すぐ見られる状態に置く過去の日数（環境変数で変更できる）
+DEFAULT_HOT_DAYS = 3
+HOT_DAYS_ENV = 'TOTALCASH_HOT_DAYS'
+
+# アーカイブを置くフォルダ
+ARCHIVE_DIR = 'app_data_archive'
+# 日ごとの集計の一覧（1行1日の JSON Lines。同じ日は後の行が有効）
+SUMMARIES_FILE = 'summaries.jsonl'
+
+
+def hot_days():
+    """すぐ見られる状態に置く過去の日数（TOTALCASH_HOT_DAYS。未設定・不正な値なら既定値）"""
+    try:
+        days = int(os.environ.get(HOT_DAYS_ENV, DEFAULT_HOT_DAYS))
+    except ValueError:
+        return DEFAULT_HOT_DAYS
+    return max(days, 0)
+
+
+def _truncate(path, length):
+    """書き込み途中で落ちた末尾を切り捨てる（その後ろに追記すると、追記した分まで読めなくなるため）"""
+    with open(path, 'r+b') as f:
+        f.truncate(length)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _gzip_members_end(path):
+    """gzip のメンバーが最後まで書けているところまでのバイト数"""
+    with open(path, 'rb') as f:
+        data = memoryview(f.read())
+    end = 0
+    while end < len(data):
+        stream = zlib.decompressobj(wbits=31)
+        try:
+            stream.decompress(data[end:])
+        except zlib.error:
+            break
+        if not stream.eof:
+            break
+        end = len(data) - len(stream.unused_data)
+    return end
+
+
+def cutoff_date(business_date, days):
+    """これより前の営業日は期間切れ（business_date の days 日前）"""
+    current_date = datetime.datetime.strptime(business_date, DATE_FORMAT)
+    return (current_date - datetime.timedelta(days=days)).strftime(DATE_FORMAT)
+
+
+class Archive:
+    """
+    期間切れの日のデータ（月ごとの '<YYYY-MM>.jsonl.gz'）
+    追記は gzip のメンバーを1つ足すだけなので、すでにある分は書き直さない
+    書き込み途中で落ちた末尾は、読み込み時（集計の一覧）・その月に初めて追記する前（月のファイル）に切り捨てる
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self._summaries = None
+        self._checked_months = set()   # 末尾を確かめた月のファイル
+
+    def _month_path(self, date):
+        return os.path.join(self.directory, date[:7] + '.jsonl.gz')
+
+    def _summaries_path(self):
+        return os.path.join(self.directory, SUMMARIES_FILE)
+
+    def _append(self, path, data, compress):
+        """1行追記して fsync する"""
+        line = (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(path, 'ab') as f:
+            f.write(gzip.compress(line) if compress else line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def summaries(self):
+        """アーカイブした日ごとの集計 {営業日: 集計}"""
+        if self._summaries is None:
+            summaries = {}
+            path = self._summaries_path()
+            end = 0
+            torn = False
+            try:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        try:
+                            if not line.endswith(b'\n'):
+                                raise ValueError(line)
+                            record = json.loads(line)
+                        except ValueError:
+                            # 書き込み途中で落ちた最後の行は捨てる
+                            torn = True
+                            break
+                        summaries[record['business_date']] = record['summary']
+                        end += len(line)
+            except FileNotFoundError:
+                pass
+            if torn:
+                _truncate(path, end)
+            self._summaries = summaries
+        return self._summaries
+
+    def dates(self):
+        """アーカイブした営業日（新しい順）"""
+        return sorted(self.summaries(), reverse=True)
+
+    def summary(self, date):
+        """アーカイブしたその日の集計（なければ None）"""
+        return self.summaries().get(date)
+
+    def put(self, date, entries, summary=None):
+        """
+        その日のデータをアーカイブに追記する（データ → 集計の順に書くので、集計があればデータもある）
+        同じ集計ですでにアーカイブしていれば何もしない（途中で落ちた後のやり直し）
+        戻り値: 追記したら True
+        """
+        summary = summary or day_summary(entries)
+        if self.summaries().get(date) == summary:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        self._check_month(date)
+        self._append(self._month_path(date), {'business_date': date, 'summary': summary, 'entries': entries}, True)
+        self._append(self._summaries_path(), {'business_date': date, 'summary': summary}, False)
+        self._summaries[date] = summary
+        return True
+
+    def _check_month(self, date):
+        """その月のファイルの末尾に書き込み途中のメンバーがあれば切り捨てる（プロセスごとに1回だけ確かめる）"""
+        path = self._month_path(date)
+        if path in self._checked_months:
+            return
+        if os.path.exists(path):
+            end = _gzip_members_end(path)
+            if end < os.path.getsize(path):
+                _truncate(path, end)
+        self._checked_months.add(path)
+
+    def day(self, date):
+        """アーカイブしたその日のデータ（その月のファイルだけを読む）"""
+        return self.days([date])[date]
+
+    def days(self, dates):
+        """
+        アーカイブした日のデータ {営業日: データ}（アーカイブにない日は空のリスト）
+        月のファイルは月ごとに1回だけ読む。各行は '{"business_date": ...' で始まるので、
+        ほかの日の行は JSON として読まない
+        ファイルは追記するだけなので、共有データのロックの外から読んでよい
+        """
+        summaries = self.summaries()
+        result = {date: [] for date in dates}
+        by_month = {}
+        for date in result:
+            if date in summaries:
+                by_month.setdefault(self._month_path(date), {})[json.dumps({'business_date': date})[:-1]] = date
+        for path, prefixes in by_month.items():
+            prefix_length = len(next(iter(prefixes)))
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        date = prefixes.get(line[:prefix_length])
+                        if date is not None:
+                            result[date] = json.loads(line)['entries']
+            except FileNotFoundError:
+                pass
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                # 書き込み途中で落ちた最後のメンバーは捨てる（それまでに読んだ分を使う）
+                pass
+        return result
+
+
+class Retention:
+    """
+    期間切れの日をアーカイブに移す（営業日の切り替えのたびに、共有データから1回だけ呼ぶ）
+    移した日は delete_day で記録保持から外す（アーカイブへの追記の後なので、途中で落ちても消えない）
+    delete_day には 'archived' を付け、集計キューブには残す
+    """
+
+    def __init__(self, archive=None, days=None):
+        self.archive = archive or Archive()
+        self.days = hot_days() if days is None else days
+
+    def expired(self, dates, business_date):
+        """dates のうち期間切れの営業日（古い順）"""
+        cutoff = cutoff_date(business_date, self.days)
+        return sorted(date for date in dates if date < cutoff)
+
+    def run(self, store, business_date):
+        """
+        store（SharedStore）の期間切れの日をアーカイブに移す
+        戻り値: 移した営業日のリスト
+        """
+        moved = []
+        for date in self.expired(store.saved_dates(), business_date):
+            self.archive.put(date, store.saved_day(date), store.saved_summary(date))
+            store.apply({'op': 'delete_day', 'date': date, 'archived': True})
+            moved.append(date)
+        return moved
@@ -0,0 +1,70 @@
+# scheduler.py
+"""
+営業日の切り替えの予約（プロセスに1つのスレッドが朝7時に1回だけ切り替える）
+切り替え = 前日のデータを記録保持して集計し、期間切れの日をアーカイブへ移す（SharedStore.ensure_business_date）
+各セッションは切り替えをせず、共有データの版（version）が変わったことで新しい営業日を表示する
+"""
+import datetime
+import threading
+
+import business_date
+
+# 切り替え時刻まででも、これより長くは待たない（秒）
+# 時計の変更やスリープからの復帰があっても、この間隔で営業日を確かめ直す
+MAX_WAIT = 60.0
+
+
+class RolloverScheduler:
+    """
+    store（SharedStore）の営業日を切り替え時刻に切り替えるスレッド
+    start() の時点でも1回確かめるので、切り替え時刻をまたいで止まっていた場合もすぐ新しい営業日になる
+    """
+
+    def __init__(self, store, now=datetime.datetime.now, max_wait=MAX_WAIT):
+        self.store = store
+        self.now = now
+        self.max_wait = max_wait
+        self.rollovers = 0        # このスケジューラーが切り替えた回数
+        self.error = None         # 最後の切り替えで起きたエラー（成功したら None に戻す）
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """
+        営業日が変わっていれば切り替える（切り替え時刻に呼ばれる1回分）
+        戻り値: 切り替えたら True
+        """
+        try:
+            rolled = self.store.ensure_business_date(business_date.business_date_of(self.now()))
+        except Exception as e:
+            # スレッドは止めずに、次の確認でやり直す
+            self.error = e
+            return False
+        self.error = None
+        if rolled:
+            self.rollovers += 1
+        return rolled
+
+    def seconds_until_next(self):
+        """次の切り替え時刻までの秒数"""
+        moment = self.now()
+        return (business_date.next_day_start(moment) - moment).total_seconds()
+
+    def start(self):
+        """今の営業日を確かめてから、切り替えを待つスレッドを開始する"""
+        self.check()
+        self._thread = threading.Thread(target=self._run, name='rollover-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            wait = min(max(self.seconds_until_next(), 0.0), self.max_wait)
+            if self._stop.wait(wait):
+                return
+            self.check()
@@ -0,0 +1,873 @@
+# storage.py
+"""売上データの保存（スナップショット + 追記ジャーナル + 営業日ごとのファイル / SQLite）"""
+import collections
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from aggregates import DailyTotals, day_summary
+from cube import SalesCube
+from business_date import current_business_date
+from day_table import ENTRY_ID, DayTable
+from retention import Retention
+
+# スナップショット（本日のデータ + 記録保持している日ごとの集計 + 'seq'。過去の日のデータは含まない）
+SNAPSHOT_FILE = 'app_data.json'
+# 記録保持している日のデータ（1日1ファイル '<営業日>.json'）を置くフォルダの名前の後ろに付ける文字
+# （app_data.json なら app_data_days/）
+DAYS_DIR_SUFFIX = '_days'
+# 記録保持している日のデータを読み込んだまま覚えておく日数
+DAY_CACHE_SIZE = 4
+# 追記ジャーナル（1行1操作の JSON Lines）
+JOURNAL_FILE = 'app_data.journal'
+# ジャーナルがこの件数を超えたらスナップショットにまとめる
+COMPACT_EVERY = 500
+# この秒数のあいだに届いた操作をまとめて1回で書き込む
+COMMIT_WINDOW = 0.05
+# 書き込み完了をこの秒数より長くは待たない（書き込みが止まっても画面が固まらないように）
+COMMIT_TIMEOUT = 30.0
+# 書き込みごとの操作数を覚えておく回数
+COMMIT_HISTORY = 200
+
+# SQLite を使う場合のデータベースファイル
+SQLITE_FILE = 'app_data.sqlite3'
+# 保存方式の切り替え（'json' または 'sqlite'）
+STORAGE_ENV = 'TOTALCASH_STORAGE'
+
+
+def empty_state(today_date=None):
+    """
+    空のデータ（本日のデータは列指向の DayTable。スナップショットではリスト）
+    記録保持している日は集計だけを持ち、データは営業日ごとのファイルに置く
+    """
+    return {
+        'today_date': today_date or current_business_date(),
+        'daily_data': DayTable(),
+        # 次に追加するデータの ID
+        'next_id': 1,
+        # 記録保持している日ごとの集計（件数・合計・店舗別合計）。キーが記録保持している営業日の一覧
+        'saved_summaries': {}
+    }
+
+
+def apply_op(state, op):
+    """
+    1件の操作をデータに反映する（画面からの操作とジャーナルの再生で共通）
+    op: {'op': 'add' | 'delete' | 'rollover' | 'save_day' | 'delete_day' | 'put_days', ...}
+    add は ID を付けたデータで op['entries'] を置き換える（ジャーナルにも ID ごと残る）
+    戻り値: 書き換える営業日ごとのファイル {営業日: データ（ファイルを消す日は None）}
+    """
+    kind = op['op']
+    daily_data = state['daily_data']
+    saved_summaries = state['saved_summaries']
+    days = {}
+
+    if kind == 'add':
+        # データを累積に追加（ID のないデータには次の番号を付ける）
+        entries = []
+        next_id = state['next_id']
+        for entry in op['entries']:
+            if ENTRY_ID not in entry:
+                entry = dict(entry, **{ENTRY_ID: next_id})
+            next_id = max(next_id, entry[ENTRY_ID] + 1)
+            entries.append(entry)
+        daily_data.extend(entries)
+        state['next_id'] = next_id
+        op['entries'] = entries
+    elif kind == 'delete':
+        # ID で削除（他のセッションが先に削除した ID は無視する）
+        ids = list(op.get('ids', ()))
+        if 'indices' in op:
+            # 以前のジャーナル（表示順の位置で削除）の再生
+            ids += daily_data.ids_at(op['indices'])
+        daily_data.delete(ids)
+    elif kind == 'rollover':
+        # 前日のデータを保存して新しい営業日を開始
+        # （期間切れの日のアーカイブは retention.Retention が切り替えの後に行う）
+        if daily_data:
+            entries = daily_data.entries()
+            days[state['today_date']] = entries
+            saved_summaries[state['today_date']] = day_summary(entries)
+        state['today_date'] = op['date']
+        state['daily_data'] = DayTable()
+    elif kind == 'save_day':
+        # 今日のデータを保存済みデータに追加
+        entries = daily_data.entries()
+        days[state['today_date']] = entries
+        saved_summaries[state['today_date']] = day_summary(entries)
+    elif kind == 'delete_day':
+        saved_summaries.pop(op['date'], None)
+        days[op['date']] = None
+    elif kind == 'put_days':
+        # 営業日ごとのデータをまとめて置き換え（一括履歴の取り込み）
+        for date, entries in op['days'].items():
+            days[date] = list(entries)
+            saved_summaries[date] = day_summary(entries)
+    else:
+        raise ValueError(f"不明な操作です: {kind}")
+    return days
+
+
+def write_atomic(path, text):
+    """一時ファイルに書いてから置き換える（途中で落ちても元のファイルが残る）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _Commit:
+    """グループコミット待ちの1操作（書き込みが終わると done がセットされる）"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout=COMMIT_TIMEOUT):
+        """ジャーナルに書き込まれるまで待つ（書き込みに失敗した・timeout 秒以内に終わらなかったら OSError）"""
+        if not self.done.wait(timeout):
+            raise OSError(f"データの書き込みが {timeout:g} 秒以内に終わりませんでした")
+        if self.error is not None:
+            raise self.error
+
+
+class JournalStore:
+    """
+    スナップショット + 追記ジャーナル + 営業日ごとのファイルによるデータ保存
+    1回の追加・削除はジャーナルに1行追記するだけなので、データ量によらず一定時間
+    書き込みは専用スレッドがまとめて行い、短い間に届いた操作は1回の fsync で確定させる
+    起動時はスナップショットを読み込み、その後のジャーナルを再生する
+
+    記録保持している日のデータは1日1ファイル（days_dir/<営業日>.json）に分け、
+    スナップショットには本日のデータと日ごとの集計だけを書くので、
+    追加・まとめ直し・起動の時間は記録保持している日数によらない。
+    営業日のファイルはジャーナルに書き込んだ後で書く（途中で落ちてもジャーナルの再生で書き直す）。
+    書き終わるまでの内容はメモリに持っておき、saved_day はそちらを返す
+    """
+
+    def __init__(self, snapshot_path=SNAPSHOT_FILE, journal_path=JOURNAL_FILE, compact_every=COMPACT_EVERY,
+                 commit_window=COMMIT_WINDOW, days_dir=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        # 省略時はスナップショットの隣（app_data.json → app_data_days/）
+        self.days_dir = days_dir or os.path.splitext(snapshot_path)[0] + DAYS_DIR_SUFFIX
+        self.compact_every = compact_every
+        self.commit_window = commit_window
+        self.seq = 0              # 最後に反映した操作の通し番号
+        self.journal_count = 0    # スナップショット以降のジャーナル件数
+        self.snapshot_count = 0   # スナップショットを書き出した回数
+        self._torn_tail = False   # ジャーナル末尾が書き込み途中で切れていたか
+        self._failure = None      # 書き込みスレッドが止まった原因（以後の操作は受け付けない）
+        self._legacy = False      # 過去の日のデータを含む以前のスナップショットだったか
+        # 書き込み待ちの操作（ジャーナルの行, _Commit, 操作名, 通し番号, 書き換える営業日のファイル）
+        self._pending = []
+        # まだファイルに書いていない営業日 {営業日: (操作の通し番号, データ または None)}
+        self._pending_days = {}
+        # 営業日ごとに、ファイルに書いた最後の操作の通し番号（古い内容で上書きしないため）
+        self._written_days = {}
+        # 読み込んだ営業日のデータ（新しく使った順に DAY_CACHE_SIZE 日分）
+        self._day_cache = collections.OrderedDict()
+        # 営業日のファイルの読み書き（_cond より先に取る）
+        self._files_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.state = self._load()
+        # 再生した操作・以前のスナップショットの分の営業日のファイルを書いておく
+        self._write_days(dict(self._pending_days))
+        if self._torn_tail or self._legacy:
+            # 壊れた行の後ろに追記しないよう / 過去の日をスナップショットから外すため、先にまとめ直す
+            self.compact()
+
+        # 1回の書き込みでまとめた操作数（直近 COMMIT_HISTORY 回分）
+        self.commit_sizes = collections.deque(maxlen=COMMIT_HISTORY)
+        self.commit_count = 0     # 書き込み回数の累計
+        self.op_count = 0         # 書き込んだ操作数の累計
+        self._writer = threading.Thread(target=self._run_writer, name='journal-writer', daemon=True)
+        self._writer.start()
+
+    @property
+    def today_date(self):
+        return self.state['today_date']
+
+    @property
+    def daily_data(self):
+        """本日のデータ（追加順の辞書のリスト）"""
+        return self.state['daily_data'].entries()
+
+    @property
+    def daily_table(self):
+        """本日のデータ（列指向）"""
+        return self.state['daily_data']
+
+    def find_daily(self, ids):
+        """本日のデータのうち ids のもの（もう無い ID は除く）"""
+        return self.state['daily_data'].find(ids)
+
+    def saved_dates(self):
+        """記録保持している営業日（新しい順）"""
+        return sorted(self.state['saved_summaries'], reverse=True)
+
+    def saved_day(self, date):
+        """記録保持しているその日のデータ（その日のファイルだけを読む）"""
+        with self._files_lock:
+            with self._cond:
+                if date in self._pending_days:
+                    return self._pending_days[date][1] or []
+                if date not in self.state['saved_summaries']:
+                    return []
+            if date in self._day_cache:
+                self._day_cache.move_to_end(date)
+                return self._day_cache[date]
+            try:
+                with open(self._day_path(date), 'r', encoding='utf-8') as f:
+                    entries = json.load(f)['entries']
+            except FileNotFoundError:
+                return []
+            self._day_cache[date] = entries
+            if len(self._day_cache) > DAY_CACHE_SIZE:
+                self._day_cache.popitem(last=False)
+            return entries
+
+    def saved_summary(self, date):
+        """記録保持しているその日の集計（データがなければ None）"""
+        return self.state['saved_summaries'].get(date)
+
+    def apply(self, op):
+        """
+        操作を反映し、ジャーナルへの書き込みを予約する
+        戻り値: _Commit（wait() で書き込み完了まで待てる）
+        """
+        commit = _Commit()
+        with self._cond:
+            if self._closed:
+                raise OSError("データの保存は終了しています")
+            if self._failure is not None:
+                raise self._failure
+            days = apply_op(self.state, op)
+            self.seq += 1
+            for date, entries in days.items():
+                self._pending_days[date] = (self.seq, entries)
+            line = json.dumps(dict(op, seq=self.seq), ensure_ascii=False) + '\n'
+            self._pending.append((line, commit, op['op'], self.seq, days))
+            self._cond.notify()
+        return commit
+
+    def flush(self):
+        """予約済みの操作がすべて書き込まれるまで待つ"""
+        with self._cond:
+            commits = [commit for _, commit, _, _, _ in self._pending]
+        for commit in commits:
+            commit.done.wait()
+
+    def close(self):
+        """残りを書き込んでから書き込みスレッドを止める"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+
+    def commit_stats(self):
+        """書き込みの集計（回数・操作数・1回あたりの平均と最大・直近の内訳・スナップショット回数）"""
+        with self._cond:
+            sizes = list(self.commit_sizes)
+            return {
+                'commits': self.commit_count,
+                'ops': self.op_count,
+                'snapshots': self.snapshot_count,
+                'avg': self.op_count / self.commit_count if self.commit_count else 0.0,
+                'max': max(sizes, default=0),
+                'recent': sizes,
+            }
+
+    def _run_writer(self):
+        """書き込みスレッド: 操作が届いたら commit_window だけ待ち、溜まった分をまとめて書く"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                closing = self._closed
+            if not closing:
+                # 同じ時間帯の操作をもう少し集める
+                time.sleep(self.commit_window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                # 想定外のエラー: 書き込みスレッドを止め、待っている操作と以後の操作にエラーを返す
+                self._fail(e, batch)
+                return
+
+    def _fail(self, exc, batch):
+        """書き込みスレッドを止めた原因を記録し、書き込み待ちの操作をすべて失敗にする"""
+        failure = OSError(f"データの書き込みが停止しました: {exc!r}")
+        with self._cond:
+            self._failure = failure
+            batch = batch + self._pending
+            self._pending = []
+        for _, commit, _, _, _ in batch:
+            if not commit.done.is_set():
+                commit.error = failure
+                commit.done.set()
+
+    def _commit_batch(self, batch):
+        """まとめた操作をジャーナルに書き、営業日のファイル・まとめ直しを行う"""
+        error = None
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(line for line, _, _, _, _ in batch))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            error = e
+
+        with self._cond:
+            if error is None:
+                self.journal_count += len(batch)
+            self.commit_sizes.append(len(batch))
+            self.commit_count += 1
+            self.op_count += len(batch)
+        for _, commit, _, _, _ in batch:
+            commit.error = error
+            commit.done.set()
+
+        if error is None:
+            # ジャーナルに書けた操作の営業日のファイルを書く
+            # （失敗したらメモリに残しておき、まとめ直しのときに書き直す）
+            try:
+                for _, _, _, seq, days in batch:
+                    self._write_days({date: (seq, entries) for date, entries in days.items()})
+            except OSError:
+                pass
+
+        if error is None and (self.journal_count >= self.compact_every
+                              or any(name == 'rollover' for _, _, name, _, _ in batch)):
+            try:
+                self.compact()
+            except OSError:
+                # まとめ直しに失敗してもジャーナルは残っているので次の機会にやり直す
+                pass
+
+    def _day_path(self, date):
+        return os.path.join(self.days_dir, date + '.json')
+
+    def _write_days(self, days):
+        """
+        営業日のファイルを書く（データが None の日はファイルを消す）
+        days: {営業日: (操作の通し番号, データ)}。すでに新しい操作の内容を書いた日は飛ばす
+        """
+        with self._files_lock:
+            for date, (seq, entries) in days.items():
+                if seq <= self._written_days.get(date, -1):
+                    continue
+                path = self._day_path(date)
+                if entries is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    os.makedirs(self.days_dir, exist_ok=True)
+                    # 集計も一緒に書いておく（このファイルだけで1日分がわかる）
+                    write_atomic(path, json.dumps(
+                        {'business_date': date, 'summary': day_summary(entries), 'entries': entries},
+                        ensure_ascii=False
+                    ))
+                self._written_days[date] = seq
+                self._day_cache.pop(date, None)
+                with self._cond:
+                    if self._pending_days.get(date, (None,))[0] == seq:
+                        del self._pending_days[date]
+
+    def compact(self):
+        """現在のデータをスナップショットに書き出し、ジャーナルを空にする"""
+        with self._cond:
+            # 書き出す内容だけロック中に確定させる（ここまでの操作はジャーナルに書き込み済みか予約中）
+            daily_data = self.state['daily_data'].entries()
+            text = json.dumps(dict(self.state, daily_data=daily_data, seq=self.seq), ensure_ascii=False)
+            days = dict(self._pending_days)
+        # スナップショットより前の操作の営業日のファイルは先に書いておく（ジャーナルを空にすると再生できないため）
+        self._write_days(days)
+        write_atomic(self.snapshot_path, text)
+        # スナップショットに 'seq' があるので、ここで落ちても再生時に二重適用されない
+        open(self.journal_path, 'w', encoding='utf-8').close()
+        with self._cond:
+            self.journal_count = 0
+            self.snapshot_count += 1
+
+    def _load(self):
+        """
+        スナップショット + ジャーナルの続きからデータを復元する
+        記録保持している日のデータは読まない（ファイルに書く必要のある日は _pending_days に入れる）
+        """
+        state = empty_state()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            state['today_date'] = data.get('today_date') or state['today_date']
+            state['next_id'] = data.get('next_id', 1)
+            state['saved_summaries'] = data.get('saved_summaries', {})
+            self.seq = data.get('seq', 0)
+            # ID のない以前のデータには読み込むたびに同じ番号が付く（次のスナップショットで保存される）
+            apply_op(state, {'op': 'add', 'entries': data.get('daily_data', [])})
+            if 'saved_daily_data' in data:
+                # 以前のスナップショット（過去の日のデータも含む）は営業日ごとのファイルに移す
+                self._legacy = True
+                for date, entries in data['saved_daily_data'].items():
+                    self._pending_days[date] = (self.seq, entries)
+                    # 集計のない古い保存データは読み込み時に集計しておく
+                    if date not in state['saved_summaries']:
+                        state['saved_summaries'][date] = day_summary(entries)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        if not line.endswith('\n'):
+                            raise ValueError(line)
+                        record = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は捨てる
+                        self._torn_tail = True
+                        break
+                    self.journal_count += 1
+                    if record['seq'] <= self.seq:
+                        continue
+                    for date, entries in apply_op(state, record).items():
+                        self._pending_days[date] = (record['seq'], entries)
+                    self.seq = record['seq']
+        return state
+
+
+# SQLite の列 ↔ データのキー
+_COLUMNS = (('time', '時刻'), ('user', '入力者'), ('store', '店舗名'), ('content', '内容'), ('amount', '金額'))
+_SELECT_ENTRY = 'SELECT time, user, store, content, amount, id FROM entries'
+_INSERT_ENTRY = (
+    'INSERT INTO entries (bucket, business_date, time, user, store, content, amount) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bucket TEXT NOT NULL,          -- 'daily'（本日分）/ 'saved'（記録保持）
+    business_date TEXT NOT NULL,
+    time TEXT,
+    user TEXT,
+    store TEXT,
+    content TEXT,
+    amount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS day_summaries (
+    business_date TEXT PRIMARY KEY,  -- 記録保持している営業日ごとの集計
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    stores TEXT NOT NULL             -- 店舗別合計（JSON）
+);
+CREATE INDEX IF NOT EXISTS idx_entries_date ON entries (business_date, bucket);
+CREATE INDEX IF NOT EXISTS idx_entries_user ON entries (business_date, user);
+CREATE INDEX IF NOT EXISTS idx_entries_store ON entries (business_date, store);
+"""
+
+
+# 1回の問い合わせで指定する ID の数（SQLite の変数の上限より少なく）
+_ID_CHUNK = 500
+
+
+def _row_to_entry(row):
+    entry = {key: value for (_, key), value in zip(_COLUMNS, row)}
+    entry[ENTRY_ID] = row[len(_COLUMNS)]
+    return entry
+
+
+def _entry_params(bucket, business_date, entry):
+    return (bucket, business_date) + tuple(entry.get(key) for _, key in _COLUMNS)
+
+
+class SqliteStore:
+    """
+    SQLite（WAL モード）によるデータ保存。JournalStore と同じ使い方
+    営業日・入力者・店舗名にインデックスがあり、表示に必要な分だけ問い合わせるので
+    過去データが増えても起動は遅くならない
+    """
+
+    def __init__(self, path=SQLITE_FILE, import_from=SNAPSHOT_FILE):
+        is_new = not os.path.exists(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self._daily_cache = None
+        self._today_date = None
+        if is_new and import_from and os.path.exists(import_from):
+            # 初回は JSON の保存データを取り込む
+            source = JournalStore(snapshot_path=import_from)
+            try:
+                self._import(source)
+            finally:
+                source.close()
+        if self._get_meta('today_date') is None:
+            with self.conn:
+                self._set_meta('today_date', current_business_date())
+        self._fill_summaries()
+
+    @property
+    def today_date(self):
+        if self._today_date is None:
+            self._today_date = self._get_meta('today_date')
+        return self._today_date
+
+    @property
+    def daily_data(self):
+        """本日のデータ（追加順の辞書のリスト）"""
+        return self.daily_table.entries()
+
+    @property
+    def daily_table(self):
+        """本日のデータ（列指向。追加・削除はそのまま反映し、営業日の切り替えまで使い続ける）"""
+        if self._daily_cache is None:
+            self._daily_cache = DayTable(self._select('daily', self.today_date))
+        return self._daily_cache
+
+    def find_daily(self, ids):
+        """本日のデータのうち ids のもの（もう無い ID は除く）"""
+        ids = list(ids)
+        found = []
+        for start in range(0, len(ids), _ID_CHUNK):
+            chunk = ids[start:start + _ID_CHUNK]
+            rows = self.conn.execute(
+                _SELECT_ENTRY + " WHERE bucket = 'daily' AND id IN (%s)" % ','.join('?' * len(chunk)), chunk
+            )
+            found.extend(_row_to_entry(row) for row in rows)
+        return found
+
+    def saved_dates(self):
+        """記録保持している営業日（新しい順。日ごとの集計の表から読むので、データの件数によらない）"""
+        rows = self.conn.execute('SELECT business_date FROM day_summaries ORDER BY business_date DESC')
+        return [row[0] for row in rows]
+
+    def saved_day(self, date):
+        """記録保持しているその日のデータ"""
+        return self._select('saved', date)
+
+    def saved_summary(self, date):
+        """記録保持しているその日の集計（データがなければ None）"""
+        row = self.conn.execute(
+            'SELECT count, total, stores FROM day_summaries WHERE business_date = ?', (date,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'件数': row[0], '合計': row[1], '店舗別': json.loads(row[2])}
+
+    def apply(self, op):
+        """操作を1トランザクションで反映する"""
+        kind = op['op']
+        today_date = self.today_date
+        try:
+            self._apply(kind, op, today_date)
+        except Exception:
+            self._daily_cache = None
+            self._today_date = None
+            raise
+        if self._daily_cache is not None and kind == 'add':
+            self._daily_cache.extend(op['entries'])
+        elif self._daily_cache is not None and kind == 'delete':
+            self._daily_cache.delete(op['ids'])
+        elif kind == 'rollover':
+            self._daily_cache = None
+            self._today_date = None
+
+    def _apply(self, kind, op, today_date):
+        with self.conn:
+            if kind == 'add':
+                # 行の id をデータの ID にする
+                entries = []
+                for entry in op['entries']:
+                    cursor = self.conn.execute(_INSERT_ENTRY, _entry_params('daily', today_date, entry))
+                    entries.append(dict(entry, **{ENTRY_ID: cursor.lastrowid}))
+                op['entries'] = entries
+            elif kind == 'delete':
+                # 主キーで削除（他のセッションが先に削除した ID は何もしない）
+                self.conn.executemany(
+                    "DELETE FROM entries WHERE id = ? AND bucket = 'daily'", [(entry_id,) for entry_id in op['ids']]
+                )
+            elif kind == 'rollover':
+                # 前日のデータを記録保持に移して新しい営業日を開始
+                daily_data = self.daily_data
+                if daily_data:
+                    self._delete_saved(today_date)
+                    self.conn.execute(
+                        "UPDATE entries SET bucket = 'saved' WHERE business_date = ? AND bucket = 'daily'",
+                        (today_date,)
+                    )
+                    self._put_summary(today_date, daily_data)
+                self._set_meta('today_date', op['date'])
+            elif kind == 'save_day':
+                self._delete_saved(today_date)
+                self.conn.execute(
+                    "INSERT INTO entries (bucket, business_date, time, user, store, content, amount) "
+                    "SELECT 'saved', business_date, time, user, store, content, amount FROM entries "
+                    "WHERE business_date = ? AND bucket = 'daily' ORDER BY id",
+                    (today_date,)
+                )
+                self._put_summary(today_date, self.daily_data)
+            elif kind == 'delete_day':
+                self._delete_saved(op['date'])
+            elif kind == 'put_days':
+                for date, entries in op['days'].items():
+                    self._delete_saved(date)
+                    self.conn.executemany(_INSERT_ENTRY, [_entry_params('saved', date, e) for e in entries])
+                    self._put_summary(date, entries)
+            else:
+                raise ValueError(f"不明な操作です: {kind}")
+
+    def compact(self):
+        """WAL をデータベース本体に書き戻す"""
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _select(self, bucket, date):
+        rows = self.conn.execute(
+            _SELECT_ENTRY + ' WHERE business_date = ? AND bucket = ? ORDER BY id', (date, bucket)
+        )
+        return [_row_to_entry(row) for row in rows]
+
+    def _delete_saved(self, date):
+        self.conn.execute("DELETE FROM entries WHERE business_date = ? AND bucket = 'saved'", (date,))
+        self.conn.execute('DELETE FROM day_summaries WHERE business_date = ?', (date,))
+
+    def _put_summary(self, date, entries):
+        summary = day_summary(entries)
+        self.conn.execute(
+            'INSERT OR REPLACE INTO day_summaries (business_date, count, total, stores) VALUES (?, ?, ?, ?)',
+            (date, summary['件数'], summary['合計'], json.dumps(summary['店舗別'], ensure_ascii=False))
+        )
+
+    def _fill_summaries(self):
+        """集計のない記録保持データ（以前のデータベース）を集計しておく"""
+        dates = [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT business_date FROM entries WHERE bucket = 'saved' "
+            "AND business_date NOT IN (SELECT business_date FROM day_summaries)"
+        )]
+        if dates:
+            with self.conn:
+                for date in dates:
+                    self._put_summary(date, self._select('saved', date))
+
+    def _get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _import(self, source):
+        """JournalStore のデータ（本日分 + 記録保持している日）を取り込む"""
+        with self.conn:
+            self._set_meta('today_date', source.today_date)
+            self.conn.executemany(
+                _INSERT_ENTRY, [_entry_params('daily', source.today_date, e) for e in source.daily_data]
+            )
+            for date in source.saved_dates():
+                entries = source.saved_day(date)
+                self.conn.executemany(_INSERT_ENTRY, [_entry_params('saved', date, e) for e in entries])
+                self._put_summary(date, entries)
+
+
+class SharedStore:
+    """
+    全セッションで共有するデータ（プロセスに1つ）
+    読み書きはロックで直列化し、変更のたびに version を1つ増やす
+    本日データの集計（DailyTotals）も操作ごとに差分で更新する
+    retention: 営業日の切り替えの後に期間切れの日をアーカイブに移す（None なら移さない）
+    cube: 記録した日の 営業日 × 店舗名 × 入力者 の集計（SalesCube）。記録保持・取り込み・削除のたびに更新する
+    """
+
+    def __init__(self, backend, retention=None, cube=None):
+        self.backend = backend
+        self.retention = retention
+        self.cube = cube
+        if cube is not None and not cube.exists():
+            # 初回はアーカイブと記録保持している日から作る
+            self._build_cube()
+        self.version = 0
+        self._lock = threading.RLock()
+        self.totals = DailyTotals(backend.daily_data)
+        # 入力者 → 店舗名 → 行番号 の索引（版が変わったときだけ作り直す）
+        self._group_index = None
+        self._group_index_version = None
+
+    @property
+    def today_date(self):
+        with self._lock:
+            return self.backend.today_date
+
+    @property
+    def daily_data(self):
+        """本日のデータ（呼び出し時点のコピー）"""
+        with self._lock:
+            return self.backend.daily_data
+
+    def saved_dates(self):
+        with self._lock:
+            return self.backend.saved_dates()
+
+    def saved_day(self, date):
+        with self._lock:
+            return list(self.backend.saved_day(date))
+
+    def saved_summary(self, date):
+        """記録保持しているその日の集計（件数・合計・店舗別合計）"""
+        with self._lock:
+            return self.backend.saved_summary(date)
+
+    def past_dates(self):
+        """記録保持またはアーカイブにある営業日（新しい順）"""
+        with self._lock:
+            dates = set(self.backend.saved_dates())
+            if self.retention is not None:
+                dates.update(self.retention.archive.dates())
+            return sorted(dates, reverse=True)
+
+    def past_days(self, dates):
+        """
+        その日ごとのデータ {営業日: データ}（記録保持になければアーカイブから読む）
+        アーカイブは追記するだけなので、ロックの外で月のファイルを1回ずつ読む
+        （月末の出力でも、その間の他のセッションの操作を待たせない）
+        """
+        days = {}
+        archived = []
+        with self._lock:
+            for date in dates:
+                if self.backend.saved_summary(date) is not None or self.retention is None:
+                    days[date] = list(self.backend.saved_day(date))
+                else:
+                    archived.append(date)
+            if archived:
+                archive = self.retention.archive
+                archive.summaries()
+        if archived:
+            days.update(archive.days(archived))
+        return days
+
+    def cube_view(self):
+        """
+        集計キューブの表示用（キューブがなければ None）
+        戻り値: {'version': キューブの版, 'frame': キューブの DataFrame}
+        """
+        with self._lock:
+            if self.cube is None:
+                return None
+            return {'version': self.cube.version, 'frame': self.cube.frame()}
+
+    def today_view(self):
+        """
+        本日データの表示用一式（同じ版の データ・集計・索引 をまとめて取り出す）
+        戻り値: {'version', 'today_date', 'frame', 'totals', 'group_index'}
+          frame: 本日データの DataFrame（列指向の配列をコピーせずに使う。行番号 = 索引の行番号）
+        """
+        with self._lock:
+            table = self.backend.daily_table
+            frame = table.to_frame()
+            if self._group_index_version != self.version:
+                self._group_index = table.group_index()
+                self._group_index_version = self.version
+            return {
+                'version': self.version,
+                'today_date': self.backend.today_date,
+                'frame': frame,
+                'totals': self.totals.snapshot(),
+                'group_index': self._group_index,
+            }
+
+    def apply(self, op):
+        """
+        操作を反映し、書き込みが終わるまで待つ
+        戻り値: True（反映できなければ例外）
+        """
+        with self._lock:
+            kind = op['op']
+            removed = []
+            sealed = None
+            if kind in ('rollover', 'save_day') and self.cube is not None:
+                # 記録保持される本日分（集計キューブに入れる）
+                sealed = (self.backend.today_date, self.backend.daily_data)
+            if kind == 'delete':
+                # 本日のデータに残っている ID だけを削除する（op['ids'] も実際に削除した ID にする）
+                removed = self.backend.find_daily(dict.fromkeys(op['ids']))
+                op['ids'] = [entry[ENTRY_ID] for entry in removed]
+            try:
+                commit = self.backend.apply(op)
+            finally:
+                self.version += 1
+            # 集計は反映できた操作の分だけ更新する
+            if kind == 'add':
+                self.totals.add(op['entries'])
+            elif kind == 'delete':
+                self.totals.remove(removed)
+            elif kind == 'rollover':
+                self.totals.reset(self.backend.daily_data)
+            if self.cube is not None:
+                self._update_cube(kind, op, sealed)
+        # 書き込み完了はロックの外で待つ（待っている間の他セッションの操作も同じ書き込みにまとまる）
+        if commit is not None:
+            commit.wait()
+        return True
+
+    def _update_cube(self, kind, op, sealed):
+        """反映した操作に合わせて集計キューブを更新する（アーカイブへ移しただけの日は残す）"""
+        if (kind == 'rollover' and sealed[1]) or kind == 'save_day':
+            self.cube.put_day(*sealed)
+        elif kind == 'put_days':
+            self.cube.put_days(op['days'])
+        elif kind == 'delete_day' and not op.get('archived'):
+            self.cube.remove_day(op['date'])
+
+    def _build_cube(self):
+        days = {}
+        if self.retention is not None:
+            archive = self.retention.archive
+            days.update(archive.days(archive.dates()))
+        for date in self.backend.saved_dates():
+            days[date] = self.backend.saved_day(date)
+        self.cube.put_days(days)
+
+    def commit_stats(self):
+        """グループコミットの集計（対応していない保存方式では None）"""
+        if hasattr(self.backend, 'commit_stats'):
+            return self.backend.commit_stats()
+        return None
+
+    def ensure_business_date(self, business_date):
+        """
+        営業日が変わっていれば1回だけ切り替え、期間切れの日をアーカイブに移す
+        戻り値: 切り替えたら True
+        """
+        with self._lock:
+            if self.backend.today_date == business_date:
+                return False
+            self.apply({'op': 'rollover', 'date': business_date})
+            if self.retention is not None:
+                self.retention.run(self, business_date)
+            return True
+
+
+def open_store():
+    """環境変数 TOTALCASH_STORAGE に応じた保存方式でデータを開く（既定は JSON）"""
+    if os.environ.get(STORAGE_ENV, 'json').lower() == 'sqlite':
+        return SharedStore(SqliteStore(), Retention(), SalesCube())
+    return SharedStore(JournalStore(), Retention(), SalesCube())
@@ -0,0 +1,438 @@
+# talk_parser.py
+"""トーク履歴の解析（金額・バック・一括履歴）"""
+import codecs
+import datetime
+import re
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+from business_date import business_date_of
+
+# バック金額定義
+BACK_VALUES = {
+    '❤': 5000,
+    '❤️': 5000,
+    '♥': 5000,  # 白いハート追加
+    '⭕': 4000,
+    '⭕️': 4000,
+    'S': 3000,
+    's': 3000,  # 小文字のsも追加
+    '🔺': 3000,  # 🔺記号を追加
+    'B': 1000,  # Bバック追加
+    'b': 1000,  # 小文字のbも追加
+    '⭐️6': 9000,
+    '⭐️7': 10000,
+    '⭐️8': 11000,
+    '⭐️9': 12000,
+    '⭐️10': 13000,
+    '⭐6': 9000,
+    '⭐7': 10000,
+    '⭐8': 11000,
+    '⭐9': 12000,
+    '⭐10': 13000,
+    'E': 2000,  # Eバック
+    'e': 2000,   # 小文字のeも追加
+    '🟢': 0,     # 🟢記号を追加（バック無し）
+}
+
+# 人数・単価の最大桁数（これを超える数字列は金額として扱わない）
+# 9桁同士の掛け算でも int64 に収まる
+MAX_DIGITS = 9
+
+# 時間パターン（19:21など）
+_TIME_RE = re.compile(r'\d{1,2}:\d{2}')
+
+# 一括履歴: 最終・追加の投稿者名
+_TRIGGER_NAME_RE = re.compile(r'\d{1,2}:\d{2}\s+(.+?)\s+.*(?:最終|追加)')
+
+# トーク履歴の日付行: '2025/08/27(水)' '2025.08.27 水曜日' '2025年8月27日(水)' など
+_DATE_HEADER_RE = re.compile(
+    r'(\d{4})[/.\-年](\d{1,2})[/.\-月](\d{1,2})日?(?:\s*[(（][^)）]{1,4}[)）]|\s+\S{1,4}曜日?)?$'
+)
+
+# 投稿者名が取れない場合の入力者名
+UNKNOWN_USER = "不明ユーザー"
+
+# トーク履歴ファイルを1回に読み込むバイト数
+CHUNK_SIZE = 1 << 20
+
+# 金額トークン: 人数 . 単価 (. 末尾ドット)
+# (?<!\d) で数字列の途中から再試行しないので、長い数字・ドット列でも線形時間
+_MONEY_RE = re.compile(r'(?<!\d)(\d+)\s*\.\s*(\d*)(\s*\.)?')
+
+# バック記号の比較で読み飛ばす文字: 異体字セレクタ（❤ と ❤️ など）とスペース
+_MARKER_SKIP = frozenset('\ufe0e\ufe0f ')
+_MARKER_TABLE = {ord(ch): None for ch in _MARKER_SKIP}
+_MARKER_TABLE.update({ord(c): c.upper() for c in 'abcdefghijklmnopqrstuvwxyz'})
+
+
+def normalize_marker(text):
+    """バック記号を正規化する（異体字セレクタ・スペース除去、英字は大文字）"""
+    return text.translate(_MARKER_TABLE)
+
+
+class BackMatcher:
+    """
+    バック記号のトライ（料金表から一度だけ構築）
+    1行を1回走査し、最も長い（具体的な）記号を返す。同じ長さなら先に出た方
+    """
+
+    def __init__(self, rates):
+        self.markers = []  # 正規化済みの記号（コード順）
+        self.values = []   # 記号ごとのバック単価
+        self._trie = {}
+        codes = {}
+        for key, value in rates.items():
+            marker = normalize_marker(key)
+            if marker in codes:
+                if self.values[codes[marker]] != value:
+                    raise ValueError(f"バック記号 {key} の単価が重複定義と一致しません")
+                continue
+            codes[marker] = len(self.markers)
+            self.markers.append(marker)
+            self.values.append(value)
+            node = self._trie
+            for ch in marker:
+                child = node.setdefault(ch, {})
+                # 小文字も同じ節点へ（'s' と 'S' を同一視）
+                node.setdefault(ch.lower(), child)
+                node = child
+            node[None] = codes[marker]
+        self._max_len = max(len(m) for m in self.markers)
+        # 記号の先頭になり得る文字だけを走査の起点にする
+        self._start_re = re.compile('[' + ''.join(re.escape(ch) for ch in self._trie) + ']')
+
+    def find(self, line):
+        """記号コードを返す（記号が無ければ -1）"""
+        trie = self._trie
+        max_len = self._max_len
+        n = len(line)
+        best = -1
+        best_len = 0
+        for m in self._start_re.finditer(line):
+            node = trie[m.group()]
+            length = 1
+            j = m.end()
+            # 記号の長さは高々 max_len なので1行あたり線形時間
+            while True:
+                code = node.get(None)
+                if code is not None and length > best_len:
+                    best, best_len = code, length
+                if length >= max_len:
+                    break
+                while j < n and line[j] in _MARKER_SKIP:
+                    j += 1
+                if j >= n:
+                    break
+                node = node.get(line[j])
+                if node is None:
+                    break
+                length += 1
+                j += 1
+            if best_len == max_len:
+                break
+        return best
+
+    def value_of(self, code):
+        """記号コードのバック単価（-1 は0）"""
+        return self.values[code] if code >= 0 else 0
+
+
+BACK_MATCHER = BackMatcher(BACK_VALUES)
+
+
+def _best_money(text):
+    """
+    時刻を除去済みの行を左から1回走査して、採用する金額トークンを返す
+    金額が見つからない場合は None
+    """
+    # 優先順位: 1.3000 (単価あり) > 2.1000. (末尾ドット) > 1. (単価なし)
+    first = dotted = None
+    for m in _MONEY_RE.finditer(text):
+        if m.group(2):
+            return m
+        if first is None:
+            first = m
+        if dotted is None and m.group(3):
+            dotted = m
+    return dotted or first
+
+
+def _scan_match(m, line):
+    """金額トークンから (人数, 単価, バック記号コード) を返す（桁数超過は None）"""
+    count_str, unit_str = m.group(1), m.group(2)
+    if len(count_str) > MAX_DIGITS or len(unit_str) > MAX_DIGITS:
+        return None
+
+    count = int(count_str)
+    unit = int(unit_str) if unit_str else 0
+    return count, unit, BACK_MATCHER.find(line)
+
+
+def _scan(line):
+    """
+    1行を解析して (人数, 単価, バック記号コード) を返す
+    金額が見つからない場合は None
+    """
+    # 時間パターン（19:21など）を除去
+    text = _TIME_RE.sub('', line) if ':' in line else line
+    m = _best_money(text)
+    if m is None:
+        return None
+    return _scan_match(m, line)
+
+
+@lru_cache(maxsize=4096)
+def _line_total(line):
+    """
+    金額行なら合計金額、金額行でなければ None を返す
+    同じ金額行（'1.3000❤️' など）は何度も出てくるので結果をキャッシュする
+    """
+    text = _TIME_RE.sub('', line) if ':' in line else line
+    m = _MONEY_RE.search(text)
+    if m is None:
+        return None
+    if not m.group(2):
+        m = _best_money(text)
+    return _total(_scan_match(m, line))
+
+
+def _total(parsed):
+    """(人数, 単価, バック記号コード) から合計金額を返す"""
+    if parsed is None:
+        return 0
+    count, unit, code = parsed
+    return count * unit + BACK_MATCHER.value_of(code) * count
+
+
+def is_money_line(line):
+    """金額（'1.3000' や '2.' など）を含む行かどうか"""
+    return _MONEY_RE.search(line) is not None
+
+
+def parse_money(line):
+    """
+    line: '2.2000S' や '1.1000 ❤' や '1 .2000❤️' や '1.300019:21❤️' や '1.0❤️' のような文字列
+    戻り値: 合計金額（人数 × 単価 + バック × 人数）
+    """
+    return _total(_scan(line))
+
+
+def pair_store_lines(lines):
+    """
+    1回毎入力の複数行: 金額行とその店舗名の組を作る
+    金額行でない行が店舗名になり、続く金額行は同じ店舗として扱う（店舗名より前の金額行は捨てる）
+    戻り値: [(店舗名, 金額行), ...]
+    """
+    pairs = []
+    current_store = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if is_money_line(line):
+            if current_store:
+                pairs.append((current_store, line))
+        else:
+            current_store = line
+    return pairs
+
+
+def parse_money_many(lines):
+    """
+    複数行をまとめて解析する
+    戻り値: {'count', 'unit', 'back', 'total'} それぞれ int64 の array（行と同じ順番）
+            'marker' はバック記号コードの array（BACK_MATCHER.markers の添字、無しは -1）
+    金額が無い行はすべて0
+    """
+    counts = array('q')
+    units = array('q')
+    backs = array('q')
+    totals = array('q')
+    markers = array('b')
+    value_of = BACK_MATCHER.value_of
+    for line in lines:
+        parsed = _scan(line)
+        if parsed is None:
+            count = unit = 0
+            code = -1
+        else:
+            count, unit, code = parsed
+        back = value_of(code)
+        counts.append(count)
+        units.append(unit)
+        backs.append(back)
+        totals.append(count * unit + back * count)
+        markers.append(code)
+    return {'count': counts, 'unit': units, 'back': backs, 'total': totals, 'marker': markers}
+
+
+def back_counts(lines):
+    """
+    バック記号ごとの (件数, 人数, バック合計)
+    戻り値: {バック記号コード: (件数, 人数, バック合計)}（記号の無い行は数えない）
+    同じ行（'1.3000❤️' など）は何度も出てくるので、異なる行ごとに1回だけ解析する
+    """
+    line_counts = Counter(lines)
+    parsed = parse_money_many(line_counts)
+    counts = {}
+    for code, count, back, times in zip(parsed['marker'], parsed['count'], parsed['back'], line_counts.values()):
+        if code < 0:
+            continue
+        rows, people, back_sum = counts.get(code, (0, 0, 0))
+        counts[code] = (rows + times, people + count * times, back_sum + back * count * times)
+    return counts
+
+
+def back_rows(counts):
+    """
+    back_counts の結果から表示用の行を作る
+    戻り値: [{'バック', '件数', '人数', 'バック合計'}, ...] バック合計の多い順
+    """
+    rows = [
+        {'バック': BACK_MATCHER.markers[code], '件数': rows, '人数': people, 'バック合計': back_sum}
+        for code, (rows, people, back_sum) in counts.items()
+    ]
+    return sorted(rows, key=lambda row: row['バック合計'], reverse=True)
+
+
+def back_stats(lines):
+    """
+    バック記号ごとの集計（集計表示用）
+    戻り値: [{'バック', '件数', '人数', 'バック合計'}, ...] バック合計の多い順
+    """
+    return back_rows(back_counts(lines))
+
+
+def _parse_time(text):
+    """'19:21' → (19, 21)"""
+    hour, minute = text.split(':')
+    return int(hour), int(minute)
+
+
+def parse_date_header(line):
+    """
+    LINE のトーク履歴の日付行（'2025/08/27(水)' や '2025.08.27 水曜日' など）を解析する
+    戻り値: datetime.date（日付行でなければ None）
+    """
+    m = _DATE_HEADER_RE.match(line.strip())
+    if m is None:
+        return None
+    try:
+        return datetime.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+def iter_talk_entries(lines, with_dates=False):
+    """
+    一括トーク履歴を先頭から1回だけ走査し、最終・追加の投稿から抽出したデータを順に返す
+    lines: 行のイテラブル（splitlines() の結果やファイルオブジェクト）
+    with_dates: True なら日付行と投稿時刻から "営業日"（朝7時前は前日扱い）と "時刻" を付ける
+                日付行より前の投稿は "営業日" が None
+    戻り値: {"入力者", "店舗名", "内容", "金額"} を1件ずつ返すジェネレータ
+
+    最終・追加を含む行で投稿ブロックが始まり、次の時刻で始まる行か日付行で終わる。
+    ブロック内では金額行の直前の行を店舗名とし、続く金額行は同じ店舗として扱う
+    """
+    in_block = False
+    current_user = None
+    current_store = None
+    pending_store = None  # 次の行が金額行なら店舗名になる行
+    current_day = None    # 直近の日付行の日付
+    last_time = None      # 直近の投稿時刻 (時, 分)
+    entry_date = entry_time = None
+
+    for raw in lines:
+        raw = raw.rstrip('\r\n')
+
+        if '最終' in raw or '追加' in raw:
+            name_match = _TRIGGER_NAME_RE.search(raw)
+            if name_match is None and in_block and not _TIME_RE.match(raw):
+                # 同じ投稿の続きの行（'追加' だけの行など）: 入力者はそのままで店舗だけ区切る
+                current_store = pending_store = None
+                continue
+            # 最終・追加の投稿: 新しいブロックを開始
+            current_user = name_match.group(1).strip() if name_match else UNKNOWN_USER
+            current_store = pending_store = None
+            in_block = True
+            if with_dates:
+                time_match = _TIME_RE.match(raw)
+                if time_match:
+                    last_time = _parse_time(time_match.group())
+                entry_date = entry_time = None
+                if last_time is not None:
+                    entry_time = "%02d:%02d" % last_time
+                    if current_day is not None:
+                        entry_date = business_date_of(datetime.datetime.combine(
+                            current_day, datetime.time(*last_time)
+                        ))
+            continue
+
+        if not (in_block or with_dates):
+            continue
+
+        if raw[:1].isdigit():
+            time_match = _TIME_RE.match(raw)
+            if time_match:
+                # 次の投稿（時刻で始まる行）でブロック終了
+                if with_dates:
+                    last_time = _parse_time(time_match.group())
+                in_block = False
+                continue
+            if raw[:4].isdigit():
+                day = parse_date_header(raw)
+                if day is not None:
+                    # 日付行: 日付を更新してブロック終了
+                    current_day = day
+                    in_block = False
+                    continue
+
+        if not in_block:
+            continue
+
+        line = raw.strip()
+        total = _line_total(line)
+
+        if total is None:
+            # 金額行でなければ店舗名の候補（空行なら候補を破棄）
+            pending_store = line or None
+            continue
+
+        # 金額行: 直前の行が店舗名候補ならその店舗に切り替える
+        if pending_store is not None:
+            current_store = pending_store
+            pending_store = None
+        if current_store:
+            entry = {
+                "入力者": current_user,
+                "店舗名": current_store,
+                "内容": line,
+                "金額": total
+            }
+            if with_dates:
+                entry = {"営業日": entry_date, "時刻": entry_time, **entry}
+            yield entry
+
+
+def iter_file_lines(fileobj, chunk_size=CHUNK_SIZE, encoding='utf-8-sig'):
+    """
+    バイナリのトーク履歴ファイルをチャンク単位で読み、1行ずつ返す
+    ファイル全体を1つの文字列にしないので、数十MBの履歴でもメモリは一定
+    戻り値: 行（改行なし）のジェネレータ
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    rest = ''
+    while True:
+        chunk = fileobj.read(chunk_size)
+        text = rest + decoder.decode(chunk, final=not chunk)
+        lines = text.split('\n')
+        # 最後の行はチャンクの途中で切れている可能性があるので次回に持ち越す
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+        if not chunk:
+            break
+    if rest:
+        yield rest.rstrip('\r')